@@ -1,29 +1,179 @@
 """
-This script generates the adjacency relationships between census tracts in Imperial County, California."""
-import geopandas as gpd
+This script generates the adjacency relationships between census tracts from the Census tract shapefiles.
+Neighbors are found with bulk STRtree queries, optionally one county per worker process with the edges
+across county lines stitched afterwards, and saved in CSR form (tracts.npy, offsets.npy, neighbors.npy)
+that main.py memory-maps directly."""
+import argparse
 import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 
-# Load the geospatial data of California Census Tracts
-shapefile_path = 'data/tl_rd22_06_tract/tl_rd22_06_tract.shp'  
-gdf = gpd.read_file(shapefile_path)
-gdf_imperial = gdf[gdf['COUNTYFP'] == '025']  # Filter for Imperial County
-gdf = gdf_imperial[['GEOID', 'geometry']]
-adjacency = {}
-for idx, tract in gdf.iterrows():
-    # Find neighboring tracts that share a boundary with the current tract
-    neighbors = gdf[gdf.geometry.touches(tract.geometry)]['GEOID'].tolist()
-    adjacency[tract['GEOID']] = neighbors
+from model_builder import unique_edges
 
-# Print adjacency results
-for tract, neighbors in adjacency.items():
-    print(f"Census Tract {tract} has neighbors: {neighbors}")
+SHAPEFILE_PATH = 'data/tl_rd22_06_tract/tl_rd22_06_tract.shp'
+ADJACENCY_DIR = 'adjacency_csr'
 
+# tracts: sorted int64 GEOIDs, offsets: n + 1 row starts, neighbors: positions into tracts
+Adjacency = namedtuple('Adjacency', ['tracts', 'offsets', 'neighbors'])
 
-# Save adjacency relationships for later use
-adjacency_file_path = 'adjacency.json'
-with open(adjacency_file_path, 'w') as f:
-    json.dump(adjacency, f)
 
-print(f"Adjacency relationships saved to: {adjacency_file_path}")
+def touching_pairs(geometries):
+    """Index pairs (i, j), i < j, of geometries that share a boundary, from one bulk STRtree query."""
+    import shapely
 
+    tree = shapely.STRtree(geometries)
+    left, right = tree.query(geometries, predicate='touches')
+    keep = left < right
+    return np.column_stack([left[keep], right[keep]])
+
+
+def _county_pairs(positions, geometries):
+    pairs = touching_pairs(geometries)
+    return positions[pairs]
+
+
+def _cross_county_pairs(geometries, counties):
+    """Pairs of touching tracts in different counties, checking only tracts on a county outline."""
+    import shapely
+
+    outlines = {}
+    for county in np.unique(counties):
+        outlines[county] = shapely.union_all(geometries[counties == county]).boundary
+    on_outline = shapely.intersects(geometries, np.array([outlines[county] for county in counties]))
+    border = np.flatnonzero(on_outline)
+    pairs = border[touching_pairs(geometries[border])]
+    return pairs[counties[pairs[:, 0]] != counties[pairs[:, 1]]]
+
+
+def build_adjacency(shapefile_paths, geoid_column='GEOID', counties=None, workers=1):
+    """Build the CSR adjacency of every tract in the given shapefiles.
+
+    `counties` optionally limits the tracts to a list of 5 digit state + county FIPS codes.
+    """
+    import geopandas as gpd
+    import pandas as pd
+
+    gdf = pd.concat([gpd.read_file(path, columns=[geoid_column]) for path in shapefile_paths], ignore_index=True)
+    geoids = gdf[geoid_column].astype(str)
+    county_codes = geoids.str[:5].to_numpy()
+    if counties:
+        keep = np.isin(county_codes, counties)
+        gdf, geoids, county_codes = gdf[keep], geoids[keep], county_codes[keep]
+    geometries = gdf.geometry.to_numpy()
+
+    unique_counties = np.unique(county_codes)
+    if workers > 1 and len(unique_counties) > 1:
+        # Within-county edges in parallel, then only the county outlines are stitched together
+        groups = [np.flatnonzero(county_codes == county) for county in unique_counties]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_county_pairs, groups, [geometries[group] for group in groups]))
+        parts.append(_cross_county_pairs(geometries, county_codes))
+        pairs = np.concatenate(parts)
+    else:
+        pairs = touching_pairs(geometries)
+
+    return to_csr(geoids.astype(np.int64).to_numpy(), pairs)
+
+
+def to_csr(tract_ids, pairs):
+    """Build a symmetric CSR adjacency from tract ids and (i, j) position pairs into them."""
+    tract_ids = np.asarray(tract_ids, dtype=np.int64)
+    order = np.argsort(tract_ids)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    pairs = unique_edges(rank[np.asarray(pairs, dtype=np.int64).reshape(-1, 2)])
+    source = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    target = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    edge_order = np.lexsort([target, source])
+    counts = np.bincount(source, minlength=len(tract_ids))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return Adjacency(tract_ids[order], offsets, target[edge_order].astype(np.int32))
+
+
+def from_json(adjacency):
+    """Convert an adjacency.json style dict of GEOID lists into CSR form."""
+    ids = np.array(sorted(set(adjacency) | {n for neighbors in adjacency.values() for n in neighbors}), dtype=np.int64)
+    counts = [len(neighbors) for neighbors in adjacency.values()]
+    source = np.repeat(np.array(list(adjacency.keys()), dtype=np.int64), counts)
+    target = np.array([n for neighbors in adjacency.values() for n in neighbors], dtype=np.int64)
+    pairs = np.column_stack([np.searchsorted(ids, source), np.searchsorted(ids, target)])
+    return to_csr(ids, pairs)
+
+
+def to_json(adjacency):
+    """Convert a CSR adjacency back into the adjacency.json dict of 11 digit GEOID strings."""
+    geoids = np.char.zfill(adjacency.tracts.astype(str), 11)
+    return {
+        geoids[i]: geoids[adjacency.neighbors[adjacency.offsets[i]:adjacency.offsets[i + 1]]].tolist()
+        for i in range(len(geoids))
+    }
+
+
+def save_adjacency(adjacency, directory=ADJACENCY_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for name, array in adjacency._asdict().items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+
+
+def load_adjacency(directory=ADJACENCY_DIR):
+    """Memory-map a saved CSR adjacency."""
+    return Adjacency(*(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in Adjacency._fields))
+
+
+def edges_for_tracts(adjacency, tract_ids):
+    """Unique (m, 2) position pairs into `tract_ids` of the adjacent tracts among them."""
+    tract_ids = np.asarray(tract_ids, dtype=np.int64)
+    tracts, offsets, neighbors = adjacency
+    if len(tracts) == 0 or len(tract_ids) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    # Global CSR row of every requested tract that has one
+    rows = np.clip(np.searchsorted(tracts, tract_ids), 0, len(tracts) - 1)
+    found = tracts[rows] == tract_ids
+    local = np.flatnonzero(found)
+    rows = rows[found]
+
+    # Gather the neighbor slices of those rows without a Python loop
+    starts = np.asarray(offsets[rows])
+    counts = np.asarray(offsets[rows + 1]) - starts
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    targets = np.asarray(neighbors[np.repeat(starts, counts) + within])
+    sources = np.repeat(local, counts)
+
+    # Map global neighbor rows back to positions in tract_ids, dropping neighbors outside it
+    order = np.argsort(rows)
+    sorted_rows = rows[order]
+    position = np.clip(np.searchsorted(sorted_rows, targets), 0, len(rows) - 1)
+    targets = np.where(sorted_rows[position] == targets, local[order][position], -1)
+    keep = targets >= 0
+    return unique_edges(np.column_stack([sources[keep], targets[keep]]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--shapefile', nargs='+', default=[SHAPEFILE_PATH], help="tract shapefiles, e.g. one per state")
+    parser.add_argument('--geoid-column', default='GEOID')
+    parser.add_argument('--counties', nargs='*', help="5 digit state + county FIPS codes to keep, e.g. 06025")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes, one county at a time")
+    parser.add_argument('--from-json', help="convert an existing adjacency.json instead of reading shapefiles")
+    parser.add_argument('--output', default=ADJACENCY_DIR)
+    parser.add_argument('--json', help="also write the adjacency.json format to this path")
+    args = parser.parse_args()
+
+    if args.from_json:
+        with open(args.from_json, 'r') as f:
+            adjacency = from_json(json.load(f))
+    else:
+        adjacency = build_adjacency(args.shapefile, args.geoid_column, args.counties, args.workers)
+
+    # Save adjacency relationships for later use
+    save_adjacency(adjacency, args.output)
+    print(f"Adjacency of {len(adjacency.tracts)} tracts ({len(adjacency.neighbors) // 2} edges) saved to: {args.output}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(to_json(adjacency), f)
+        print(f"Adjacency relationships saved to: {args.json}")
@@ -0,0 +1,70 @@
+"""
+This module holds the comparison allocations used by baseline.py and proportional.py, so they can also be
+run on other data (e.g. the synthetic counties in benchmark.py). Both take a DataFrame in the atlas format
+and return it with an Assigned_Supermarkets column."""
+import numpy as np
+
+
+def random_allocation(data, total_supermarkets, random_state=np.random):
+    """Random allocation of supermarkets to census tracts, summing to total_supermarkets.
+
+    `random_state` is anything with numpy's legacy dirichlet/choice interface; the default global state is
+    what baseline.py seeds.
+    """
+    data = data.copy()
+
+    # Step 1: Create Random Allocation of Supermarkets
+    # Generate random allocations that sum to TOTAL_NEW_SUPERMARKETS
+    random_weights = random_state.dirichlet(np.ones(len(data)), size=1)
+    data['Random_Allocation'] = (random_weights[0] * total_supermarkets).round()
+
+    # Step 2: Adjust to Match TOTAL_NEW_SUPERMARKETS exactly
+    initial_total = data['Random_Allocation'].sum()
+    difference = total_supermarkets - int(initial_total)
+
+    if difference > 0:
+        # Add supermarkets randomly to make up the difference
+        add_indices = random_state.choice(data.index, size=difference, replace=False)
+        data.loc[add_indices, 'Random_Allocation'] += 1
+    elif difference < 0:
+        # Remove supermarkets randomly to match the total
+        remove_indices = random_state.choice(data.index, size=abs(difference), replace=False)
+        data.loc[remove_indices, 'Random_Allocation'] -= 1
+
+    # Renaming column for clarity
+    return data.rename(columns={'Random_Allocation': 'Assigned_Supermarkets'})
+
+
+def proportional_allocation(data, total_supermarkets):
+    """Allocation of supermarkets in proportion to each tract's population, summing to total_supermarkets.
+
+    When rounding has to be corrected, the result is sorted by population proportion.
+    """
+    data = data.copy()
+
+    # Step 1: Calculate Population Proportion
+    # float64, so the proportions do not depend on the cache's float32 columns
+    population = data['POP2010'].astype(np.float64)
+    data['Population_Proportion'] = population / population.sum()
+
+    # Step 2: Initial Supermarket Allocation Based on Population Proportion
+    data['Initial_Supermarkets'] = (data['Population_Proportion'] * total_supermarkets).round()
+
+    # Step 3: Adjust to Match TOTAL_NEW_SUPERMARKETS exactly
+    initial_total = data['Initial_Supermarkets'].sum()
+
+    # Calculate difference to adjust to TOTAL_NEW_SUPERMARKETS
+    difference = total_supermarkets - int(initial_total)
+
+    # Adjustment based on population proportion
+    if difference > 0:
+        # Add supermarkets to tracts with the highest population proportion
+        data = data.sort_values('Population_Proportion', ascending=False)
+        data.iloc[:difference, data.columns.get_loc('Initial_Supermarkets')] += 1
+    elif difference < 0:
+        # Remove supermarkets from tracts with the lowest population proportion
+        data = data.sort_values('Population_Proportion')
+        data.iloc[:abs(difference), data.columns.get_loc('Initial_Supermarkets')] -= 1
+
+    # Renaming column for clarity
+    return data.rename(columns={'Initial_Supermarkets': 'Assigned_Supermarkets'})
@@ -0,0 +1,157 @@
+"""
+This script turns the random baseline into an ensemble: it draws many random allocations of supermarkets to
+census tracts (the same Dirichlet weights as baseline.py, but with an exact-sum multinomial draw instead of
+round-and-patch), scores each batch as soon as it is drawn and keeps only streaming statistics of every
+metric. It reports where the main.py allocation ranks against the random draws."""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from evaluator import METRICS, tract_attributes, evaluate_chunk, allocation_matrix
+
+TOTAL_NEW_SUPERMARKETS = 30
+HISTOGRAM_BINS = 20000
+BATCH_SIZE = 65536           # upper limit on the draws per batch
+BATCH_BYTES = 16 * 2 ** 20   # size of each (draws x tracts) array a worker holds; there are three per batch
+
+
+class RunningStats:
+    """Mergeable count, mean and variance (Chan et al.) and a fixed-range histogram for quantiles of one metric.
+
+    Also counts draws below and equal to a target value, for an exact percentile rank.
+    """
+
+    def __init__(self, low, high, target):
+        self.low, self.high, self.target = low, high, target
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        self.below = 0
+        self.equal = 0
+
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        self.merge_moments(len(values), values.mean() if len(values) else 0.0,
+                           ((values - values.mean()) ** 2).sum() if len(values) else 0.0)
+        bins = ((values - self.low) / (self.high - self.low) * HISTOGRAM_BINS).astype(np.int64)
+        self.histogram += np.bincount(np.clip(bins, 0, HISTOGRAM_BINS - 1), minlength=HISTOGRAM_BINS)
+        self.below += int((values < self.target - 1e-9).sum())
+        self.equal += int((np.abs(values - self.target) <= 1e-9).sum())
+
+    def merge_moments(self, count, mean, m2):
+        total = self.count + count
+        if total == 0:
+            return
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def merge(self, other):
+        self.merge_moments(other.count, other.mean, other.m2)
+        self.histogram += other.histogram
+        self.below += other.below
+        self.equal += other.equal
+
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def quantile(self, q):
+        position = np.searchsorted(np.cumsum(self.histogram), q * self.count)
+        return self.low + (position + 0.5) / HISTOGRAM_BINS * (self.high - self.low)
+
+    def percentile_rank(self):
+        """Percent of draws below the target, counting ties as half."""
+        return 100 * (self.below + 0.5 * self.equal) / self.count if self.count else np.nan
+
+
+def metric_ranges(attributes):
+    """Range every metric can take, for the histogram bins."""
+    income = attributes['income'][attributes['income_valid'] > 0]
+    spread = (income.max() - income.min()) ** 2 / 4 if len(income) else 1.0
+    ranges = {metric: (0.0, 100.0) for metric in METRICS}
+    ranges['income_balance'] = (0.0, max(spread, 1.0))
+    return ranges
+
+
+def batch_rows(num_tracts, batch_size=BATCH_SIZE, batch_bytes=BATCH_BYTES):
+    """Draws per batch, so the weights, counts and served matrices stay near batch_bytes each whatever the
+    number of tracts; batch_size caps it."""
+    return max(1, min(batch_size, batch_bytes // (8 * max(num_tracts, 1))))
+
+
+def run_worker(seed_sequence, num_draws, batch_size, attributes, targets, total, batch_bytes=BATCH_BYTES):
+    """Draw and score num_draws random allocations in batches with this worker's own RNG stream."""
+    rng = np.random.default_rng(seed_sequence)
+    num_tracts = len(attributes['snap'])
+    batch_size = batch_rows(num_tracts, batch_size, batch_bytes)
+    stats = {metric: RunningStats(*metric_ranges(attributes)[metric], targets[metric]) for metric in METRICS}
+    remaining = num_draws
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        weights = rng.dirichlet(np.ones(num_tracts), size=size)
+        allocations = rng.multinomial(total, weights)
+        metrics = evaluate_chunk(allocations, attributes)
+        for metric in METRICS:
+            stats[metric].update(metrics[metric])
+        remaining -= size
+    return stats
+
+
+def run_ensemble(attributes, targets, num_draws, workers, batch_size=BATCH_SIZE, seed=0, total=TOTAL_NEW_SUPERMARKETS,
+                 batch_bytes=BATCH_BYTES):
+    """Merged statistics of num_draws random allocations drawn across independent worker streams."""
+    streams = np.random.SeedSequence(seed).spawn(workers)
+    shares = [num_draws // workers + (i < num_draws % workers) for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_worker, stream, share, batch_size, attributes, targets, total, batch_bytes)
+                   for stream, share in zip(streams, shares) if share]
+        results = [future.result() for future in futures]
+    stats = results[0]
+    for result in results[1:]:
+        for metric in METRICS:
+            stats[metric].merge(result[metric])
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--draws', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="most draws per batch")
+    parser.add_argument('--batch-bytes', type=int, default=BATCH_BYTES,
+                        help="memory per (draws x tracts) array; sets the draws per batch for the county size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--allocation', default='assigned_supermarkets.csv', help="allocation to rank against the ensemble")
+    parser.add_argument('--output', default='baseline_ensemble.csv')
+    args = parser.parse_args()
+
+    main = pd.read_csv(args.allocation)
+    attributes = tract_attributes(main)
+    target_metrics = evaluate_chunk(allocation_matrix([main], main['CensusTract']), attributes)
+    targets = {metric: float(target_metrics[metric][0]) for metric in METRICS}
+
+    start = time.perf_counter()
+    stats = run_ensemble(attributes, targets, args.draws, args.workers, args.batch_size, args.seed,
+                         batch_bytes=args.batch_bytes)
+    elapsed = time.perf_counter() - start
+
+    summary = pd.DataFrame([{
+        'metric': metric,
+        'mean': stats[metric].mean,
+        'std': stats[metric].std(),
+        'p05': stats[metric].quantile(0.05),
+        'p50': stats[metric].quantile(0.50),
+        'p95': stats[metric].quantile(0.95),
+        'allocation': targets[metric],
+        'percentile_rank': stats[metric].percentile_rank(),
+    } for metric in METRICS])
+    summary.to_csv(args.output, index=False)
+    print(summary.to_string(index=False))
+    print(f"{args.draws} random allocations scored in {elapsed:.1f}s; results saved to: {args.output}")
+    print("Lower income_balance is better, so its percentile rank counts the random draws that beat the allocation.")
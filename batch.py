@@ -0,0 +1,192 @@
+"""
+This script solves the supermarket allocation model from main.py for every county in the atlas. Counties are
+built and solved in a pool of worker processes, and each finished county is logged to <output>/progress.jsonl
+and, if solved, written to <output>/<State>/<County>.csv straight away, so memory stays bounded and a rerun
+skips the counties that are already solved (Infeasible, NotSolved and failed counties get no CSV and are
+retried)."""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from data_loader import build_cache, csv_types, list_counties, load_county, ATLAS_PATH, CACHE_DIR
+from heuristic import solve_heuristic
+from presolve import solve_presolved
+from solver import SolveOptions, FEASIBLE_STATUSES
+from model_builder import build_model, solve_model, assigned_supermarkets, TOTAL_NEW_SUPERMARKETS, ADJACENCY_LIMIT, \
+    MAX_SUPERMARKETS_PER_TRACT, ALPHA, BETA
+
+OUTPUT_DIR = 'batch_output'
+SELECTED_COLUMNS = ['CensusTract', 'POP2010', 'TractSNAP', 'MedianFamilyIncome']
+
+
+def county_path(output_dir, state, county):
+    return os.path.join(output_dir, state.replace(os.sep, '_'), f"{county.replace(os.sep, '_')}.csv")
+
+
+def finished_counties(output_dir):
+    """(State, County) pairs logged as solved whose output file still exists."""
+    progress_path = os.path.join(output_dir, 'progress.jsonl')
+    if not os.path.exists(progress_path):
+        return set()
+    finished = set()
+    with open(progress_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial line from an interrupted run
+            # Time-limit and transient failures are not skipped, so a rerun retries them
+            if record['status'] in FEASIBLE_STATUSES + ('Empty',) and os.path.exists(county_path(output_dir, record['state'], record['county'])):
+                finished.add((record['state'], record['county']))
+    return finished
+
+
+def solve_county(state, county, options):
+    """Build and solve one county's model in a worker process."""
+    from adjacency import load_adjacency, edges_for_tracts
+
+    start = time.perf_counter()
+    county_data = load_county(state, county, SELECTED_COLUMNS, options['atlas_path'], options['cache_dir'])
+    # Tracts with a suppressed population, SNAP or income value cannot be scored, so they are left out
+    county_data = county_data.dropna(subset=SELECTED_COLUMNS).reset_index(drop=True)
+    tracts = county_data['CensusTract'].to_numpy()
+    if options['adjacency_dir'] and os.path.isdir(options['adjacency_dir']):
+        edges = edges_for_tracts(load_adjacency(options['adjacency_dir']), tracts)
+    else:
+        edges = np.empty((0, 2), dtype=np.int64)
+
+    # Counties with fewer tracts than the budget get as many supermarkets as they can hold
+    budget = min(options['total_supermarkets'], len(tracts) * options['max_per_tract'])
+    model = build_model(tracts, county_data['POP2010'], county_data['TractSNAP'], county_data['MedianFamilyIncome'],
+                        edges, total_supermarkets=budget, adjacency_limit=options['adjacency_limit'],
+                        max_per_tract=options['max_per_tract'], alpha=options['alpha'], beta=options['beta'])
+    build_time = time.perf_counter() - start
+
+    if not len(tracts):
+        county_data['Assigned_Supermarkets'] = []
+        return {'state': state, 'county': county, 'tracts': 0, 'status': 'Empty'}, county_data
+
+    start = time.perf_counter()
+    if options.get('solver') == 'heuristic':
+        result = solve_heuristic(model)
+    elif options['presolve']:
+        result, report = solve_presolved(model, options['solve_options'])
+    else:
+        result = solve_model(model, options['solve_options'])
+    solve_time = time.perf_counter() - start
+
+    county_data['Assigned_Supermarkets'] = assigned_supermarkets(model, result)
+    record = {
+        'state': state,
+        'county': county,
+        'tracts': len(tracts),
+        'edges': len(edges),
+        'budget': budget,
+        'status': result.status,
+        'objective': result.objective,
+        'gap': result.gap,
+        'nodes': result.nodes,
+        'rows': report.rows_after if options['presolve'] and options.get('solver') != 'heuristic' else len(model.rhs),
+        'build_seconds': round(build_time, 4),
+        'solve_seconds': round(solve_time, 4),
+    }
+    return record, county_data
+
+
+def write_county(output_dir, state, county, county_data):
+    """Write one county's allocation atomically, so a crash never leaves a partial file behind."""
+    path = county_path(output_dir, state, county)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    csv_types(county_data).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def remove_county(output_dir, state, county):
+    """Delete a county's allocation file left from an earlier run, if any."""
+    path = county_path(output_dir, state, county)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def run_batch(options, workers, output_dir=OUTPUT_DIR, states=None):
+    build_cache(SELECTED_COLUMNS, options['atlas_path'], options['cache_dir'])
+    counties = list_counties(options['atlas_path'], options['cache_dir'])
+    if states:
+        counties = [(state, county) for state, county in counties if state in states]
+    done = finished_counties(output_dir)
+    pending = [(state, county) for state, county in counties if (state, county) not in done]
+    print(f"{len(counties)} counties, {len(counties) - len(pending)} already finished, {len(pending)} to solve")
+
+    os.makedirs(output_dir, exist_ok=True)
+    statuses = {}
+    total_tracts = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            open(os.path.join(output_dir, 'progress.jsonl'), 'a') as progress:
+        futures = {pool.submit(solve_county, state, county, options): (state, county) for state, county in pending}
+        for number, future in enumerate(as_completed(futures), 1):
+            state, county = futures[future]
+            try:
+                record, county_data = future.result()
+                # Infeasible or unfinished solves leave values that break the limits or the budget, so only
+                # progress.jsonl records them
+                if record['status'] in FEASIBLE_STATUSES + ('Empty',):
+                    write_county(output_dir, state, county, county_data)
+                else:
+                    remove_county(output_dir, state, county)
+            except Exception as error:
+                record = {'state': state, 'county': county, 'status': 'Error', 'error': repr(error)}
+            progress.write(json.dumps(record) + '\n')
+            progress.flush()
+
+            statuses[record['status']] = statuses.get(record['status'], 0) + 1
+            total_tracts += record.get('tracts', 0)
+            print(f"[{number}/{len(pending)}] {county}, {state}: {record['status']} "
+                  f"({record.get('tracts', 0)} tracts, solve {record.get('solve_seconds', 0):.2f}s)")
+
+    elapsed = time.perf_counter() - start
+    print(f"Solved {len(pending)} counties ({total_tracts} tracts) in {elapsed:.1f}s: "
+          f"{len(pending) / elapsed if elapsed else 0:.2f} counties/s, {total_tracts / elapsed if elapsed else 0:.0f} tracts/s")
+    print("Status counts:", statuses)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default=OUTPUT_DIR)
+    parser.add_argument('--states', nargs='*', help="only solve counties in these states")
+    parser.add_argument('--atlas', default=ATLAS_PATH)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--adjacency', default='adjacency_csr', help="CSR adjacency directory covering the counties")
+    parser.add_argument('--total-supermarkets', type=int, default=TOTAL_NEW_SUPERMARKETS)
+    parser.add_argument('--adjacency-limit', type=int, default=ADJACENCY_LIMIT)
+    parser.add_argument('--max-per-tract', type=int, default=MAX_SUPERMARKETS_PER_TRACT)
+    parser.add_argument('--alpha', type=float, default=ALPHA)
+    parser.add_argument('--beta', type=float, default=BETA)
+    parser.add_argument('--threads', type=int, default=1, help="CBC threads per worker")
+    parser.add_argument('--time-limit', type=float, help="CBC time limit per county, in seconds")
+    parser.add_argument('--gap', type=float, help="relative MIP gap at which a county counts as solved")
+    parser.add_argument('--solver', choices=['cbc', 'heuristic'], default='cbc',
+                        help="CBC, or the greedy + local search heuristic with an LP bound (heuristic.py)")
+    parser.add_argument('--no-presolve', action='store_true', help="hand CBC the full model, without presolve.py")
+    args = parser.parse_args()
+
+    options = {
+        'atlas_path': args.atlas,
+        'cache_dir': args.cache_dir,
+        'adjacency_dir': args.adjacency,
+        'total_supermarkets': args.total_supermarkets,
+        'adjacency_limit': args.adjacency_limit,
+        'max_per_tract': args.max_per_tract,
+        'alpha': args.alpha,
+        'beta': args.beta,
+        'solve_options': SolveOptions(threads=args.threads, time_limit=args.time_limit, gap_rel=args.gap),
+        'presolve': not args.no_presolve,
+        'solver': args.solver,
+    }
+    run_batch(options, args.workers, args.output, args.states)
@@ -0,0 +1,103 @@
+"""
+This script tracks how the whole pipeline scales with the number of tracts. For each size it generates a
+synthetic county (synthetic.py) and profiles the CSP model build and CBC solve, the heuristic allocator
+(heuristic.py), the random and proportional allocations and the evaluation of all three, each size in a fresh
+process so the peak memory is its own.
+Every stage is appended to the output as a JSON line (see profiling.py), and --compare flags stages that got
+slower than in an earlier results file, e.g. `python benchmark.py --compare benchmark_previous.jsonl`."""
+import argparse
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from allocators import random_allocation, proportional_allocation
+from evaluator import tract_attributes, evaluate, allocation_matrix
+from heuristic import solve_heuristic
+from model_builder import build_model, TOTAL_NEW_SUPERMARKETS
+from presolve import solve_presolved
+from profiling import Profiler
+from solver import SolveOptions
+from synthetic import synthetic_frame
+
+SIZES = [31, 1000, 10000, 100000]
+BUDGET_FRACTION = 0.01   # supermarkets per tract, never fewer than TOTAL_NEW_SUPERMARKETS
+NOISE_SECONDS = 0.05     # stages faster than this are too noisy to flag
+
+
+def run_size(size, seed, output, options):
+    """Profile every stage for one synthetic county; returns the stage records."""
+    profiler = Profiler(output, size=size, seed=seed)
+    budget = min(max(TOTAL_NEW_SUPERMARKETS, round(BUDGET_FRACTION * size)), size)
+
+    with profiler.stage('generate') as stage:
+        data, edges = synthetic_frame(size, seed)
+        stage['edges'] = len(edges)
+
+    with profiler.stage('csp_build') as stage:
+        model = build_model(data['CensusTract'], data['POP2010'], data['TractSNAP'], data['MedianFamilyIncome'],
+                            edges, total_supermarkets=budget)
+        stage['model'] = model
+    with profiler.stage('csp_solve') as stage:
+        result, report = solve_presolved(model, options)
+        stage.update({'status': result.status, 'gap': result.gap, 'nodes': result.nodes,
+                      'presolved_rows': report.rows_after, 'presolved_variables': report.columns_after})
+    csp = data.assign(Assigned_Supermarkets=np.round(result.values[:size]))
+    with profiler.stage('heuristic') as stage:
+        heuristic = solve_heuristic(model)
+        stage.update({'status': heuristic.status, 'gap': heuristic.gap, 'moves': heuristic.nodes,
+                      'objective_vs_csp': heuristic.objective - result.objective})
+
+    with profiler.stage('random'):
+        random = random_allocation(data, budget, np.random.RandomState(seed))
+    with profiler.stage('proportional'):
+        proportional = proportional_allocation(data, budget)
+
+    with profiler.stage('evaluate'):
+        attributes = tract_attributes(data)
+        evaluate(allocation_matrix([csp, proportional, random], data['CensusTract']), attributes)
+    return profiler.records
+
+
+def regressions(records, previous, tolerance):
+    """(size, stage, seconds, previous seconds) of stages more than `tolerance` times slower than before."""
+    before = {(record['size'], record['stage']): record['seconds'] for record in previous}
+    return [(record['size'], record['stage'], record['seconds'], before[record['size'], record['stage']])
+            for record in records
+            if (record['size'], record['stage']) in before and record['seconds'] > NOISE_SECONDS
+            and record['seconds'] > tolerance * before[record['size'], record['stage']]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=1, help="CBC threads")
+    parser.add_argument('--time-limit', type=float, default=60, help="CBC time limit per solve, in seconds")
+    parser.add_argument('--output', default='benchmark_results.jsonl')
+    parser.add_argument('--compare', help="earlier results file to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="slowdown factor that counts as a regression")
+    args = parser.parse_args()
+
+    options = SolveOptions(threads=args.threads, time_limit=args.time_limit)
+    records = []
+    # One task per process, so ru_maxrss is the peak of that size alone
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+        for size in args.sizes:
+            size_records = pool.submit(run_size, size, args.seed, args.output, options).result()
+            records += size_records
+            print(f"{size:>7} tracts: " + ", ".join(f"{record['stage']} {record['seconds']:.3f}s"
+                                                    for record in size_records)
+                  + f"; peak RSS {max(record['peak_rss_mb'] for record in size_records):.0f} MB")
+    print(f"Benchmark results appended to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = [json.loads(line) for line in f if line.strip()]
+        slower = regressions(records, previous, args.tolerance)
+        for size, stage, seconds, before in slower:
+            print(f"Regression: {stage} at {size} tracts took {seconds:.3f}s, was {before:.3f}s")
+        if slower:
+            sys.exit(1)
+        print(f"No stage more than {args.tolerance}x slower than in {args.compare}")
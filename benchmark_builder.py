@@ -0,0 +1,92 @@
+"""
+This script benchmarks how long it takes to build the supermarket allocation model as the number of
+tracts grows, comparing the array builder in model_builder.py with the per-tract PuLP build in main.py."""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from pulp import LpProblem, LpVariable, LpInteger, LpMaximize, lpSum, LpBinary
+
+from model_builder import build_model, write_mps, solve_model, TOTAL_NEW_SUPERMARKETS, ADJACENCY_LIMIT, \
+    MAX_SUPERMARKETS_PER_TRACT, ALPHA, BETA
+from synthetic import synthetic_county
+
+
+def build_pulp_problem(tracts, population, snap, income, edges):
+    """The main.py formulation, built one PuLP expression at a time."""
+    tracts = [str(tract) for tract in tracts]
+    problem = LpProblem("SupermarketAllocation", LpMaximize)
+    supermarkets = {
+        tract: LpVariable(f"supermarkets_{tract}", 0, MAX_SUPERMARKETS_PER_TRACT, LpInteger)
+        for tract in tracts
+    }
+    has_supermarket = {
+        tract: LpVariable(f"has_supermarket_{tract}", 0, 1, LpBinary)
+        for tract in tracts
+    }
+    for tract in tracts:
+        problem += supermarkets[tract] - MAX_SUPERMARKETS_PER_TRACT * has_supermarket[tract] <= 0, f"LinkBinary_{tract}"
+    max_population = max(population)
+    max_low_income = max(snap)
+    mean_income = np.mean(income)
+    problem += (
+        lpSum([
+            ALPHA * (snap[i] / max_low_income) * supermarkets[tract] +
+            BETA * (population[i] / max_population) * supermarkets[tract]
+            for i, tract in enumerate(tracts)
+        ])
+        - lpSum([
+            has_supermarket[tract] * (income[i] - mean_income) ** 2
+            for i, tract in enumerate(tracts)
+        ])
+    ), "MaximizeCombinedCoverageAndMinimizeVariance"
+    problem += lpSum(supermarkets.values()) == TOTAL_NEW_SUPERMARKETS, "TotalSupermarketsLimit"
+    seen = set()
+    for a, b in edges:
+        tract, neighbor = tracts[a], tracts[b]
+        if (tract, neighbor) not in seen and (neighbor, tract) not in seen:
+            problem += supermarkets[tract] + supermarkets[neighbor] <= ADJACENCY_LIMIT, f"AdjacencyLimit_{tract}_{neighbor}"
+            seen.add((tract, neighbor))
+            seen.add((neighbor, tract))
+    return problem
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--sizes', type=int, nargs='+', default=[31, 1000, 10000, 100000, 300000])
+parser.add_argument('--pulp-max', type=int, default=100000, help="largest size to also build with PuLP")
+parser.add_argument('--solve', action='store_true', help="also solve with CBC and compare objectives")
+args = parser.parse_args()
+
+print(f"{'tracts':>8} {'edges':>8} {'build(s)':>9} {'mps(s)':>8} {'pulp(s)':>8} {'pulp mps(s)':>11}")
+with tempfile.TemporaryDirectory() as tmp_dir:
+    for size in args.sizes:
+        tracts, population, snap, income, edges = synthetic_county(size)
+
+        start = time.perf_counter()
+        model = build_model(tracts, population, snap, income, edges)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        write_mps(model, os.path.join(tmp_dir, 'matrix.mps'))
+        mps_time = time.perf_counter() - start
+
+        pulp_time = pulp_mps_time = float('nan')
+        if size <= args.pulp_max:
+            start = time.perf_counter()
+            problem = build_pulp_problem(tracts, population, snap, income, edges)
+            pulp_time = time.perf_counter() - start
+            start = time.perf_counter()
+            problem.writeMPS(os.path.join(tmp_dir, 'pulp.mps'))
+            pulp_mps_time = time.perf_counter() - start
+
+        print(f"{size:>8} {len(model.edges):>8} {build_time:>9.3f} {mps_time:>8.3f} {pulp_time:>8.3f} {pulp_mps_time:>11.3f}")
+
+        if args.solve:
+            result = solve_model(model)
+            print(f"         matrix model: {result.status} objective {result.objective:.6f}")
+            if size <= args.pulp_max:
+                from pulp import PULP_CBC_CMD, value
+                problem.solve(PULP_CBC_CMD(msg=False))
+                print(f"         pulp model:   objective {value(problem.objective):.6f}")
@@ -0,0 +1,72 @@
+"""
+This module precomputes which census tracts are within R miles of each other, for distance-based coverage.
+Tract internal points from the Census shapefiles go into a KD-tree on the unit sphere, and the pairs within the
+radius are cached on disk in the same memory-mapped CSR format as adjacency.py, one directory per radius."""
+import json
+import os
+
+import numpy as np
+
+from adjacency import to_csr, save_adjacency, load_adjacency, edges_for_tracts
+
+CENTROID_SOURCE = 'imperial_county_supp/imperial_county.shp'
+COVERAGE_DIR = 'data/coverage_cache'
+EARTH_RADIUS_MILES = 3958.8
+
+
+def tract_centroids(shapefile_path=CENTROID_SOURCE):
+    """GEOIDs and internal point latitude/longitude of every tract, read without the polygons."""
+    import geopandas as gpd
+
+    columns = gpd.read_file(shapefile_path, rows=0).columns
+    suffix = '10' if 'GEOID10' in columns else ''
+    names = [f"GEOID{suffix}", f"INTPTLAT{suffix}", f"INTPTLON{suffix}"]
+    table = gpd.read_file(shapefile_path, columns=names, ignore_geometry=True)
+    return (table[names[0]].astype(np.int64).to_numpy(), table[names[1]].astype(float).to_numpy(),
+            table[names[2]].astype(float).to_numpy())
+
+
+def unit_vectors(latitude, longitude):
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    return np.column_stack([np.cos(latitude) * np.cos(longitude), np.cos(latitude) * np.sin(longitude),
+                            np.sin(latitude)])
+
+
+def build_coverage(tract_ids, latitude, longitude, radius_miles):
+    """CSR of the tract pairs whose internal points are within radius_miles along the earth's surface."""
+    from scipy.spatial import cKDTree
+
+    # Great-circle distance d maps to chord length 2 sin(d / 2R) between unit vectors
+    chord = 2 * np.sin(radius_miles / (2 * EARTH_RADIUS_MILES))
+    tree = cKDTree(unit_vectors(latitude, longitude))
+    pairs = tree.query_pairs(chord, output_type='ndarray')
+    return to_csr(tract_ids, pairs)
+
+
+def cached_coverage(radius_miles, shapefile_path=CENTROID_SOURCE, cache_dir=COVERAGE_DIR):
+    """Load the coverage CSR for a radius, building and caching it the first time."""
+    directory = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(shapefile_path))[0]}_{radius_miles:g}mi")
+    stat = os.stat(shapefile_path)
+    stamp = {'path': os.path.abspath(shapefile_path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+    stamp_path = os.path.join(directory, 'source.json')
+    if os.path.exists(stamp_path):
+        with open(stamp_path, 'r') as f:
+            if json.load(f) == stamp:
+                return load_adjacency(directory)
+
+    save_adjacency(build_coverage(*tract_centroids(shapefile_path), radius_miles), directory)
+    with open(stamp_path, 'w') as f:
+        json.dump(stamp, f)
+    return load_adjacency(directory)
+
+
+def coverage_matrix(coverage, tract_ids):
+    """Sparse (tracts x tracts) matrix of which tracts are within the radius, each tract covering itself."""
+    from scipy.sparse import coo_matrix, identity
+
+    n = len(tract_ids)
+    pairs = edges_for_tracts(coverage, tract_ids)
+    rows = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    cols = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    within = coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+    return (within + identity(n, format='coo')).tocsr()
@@ -0,0 +1,137 @@
+"""
+This module loads tracts from the Food Access Research Atlas for main.py, baseline.py and proportional.py.
+The first load converts the columns it needs into a binary cache (one .npy file per column, rows sorted by
+state and county, with an index of row ranges per county), so later loads memory-map just one county's rows
+instead of parsing the full national CSV."""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+ATLAS_PATH = 'data/food_access_research_atlas.csv'
+CACHE_DIR = 'data/atlas_cache'
+DEFAULT_COLUMNS = ['CensusTract', 'POP2010', 'TractSNAP', 'MedianFamilyIncome']
+
+# CensusTract is the only integer column, every other numeric column is a count or rate stored as float32
+INTEGER_COLUMNS = {'CensusTract': np.int64}
+KEY_COLUMNS = ['State', 'County']
+
+
+def _column_dtype(column):
+    return INTEGER_COLUMNS.get(column, np.float32)
+
+
+def _cache_file(cache_dir, column):
+    return os.path.join(cache_dir, f"{column}.npy")
+
+
+def _source_stamp(atlas_path):
+    stat = os.stat(atlas_path)
+    return {'path': os.path.abspath(atlas_path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _read_index(cache_dir):
+    index_path = os.path.join(cache_dir, 'index.json')
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+
+def _save_atomic(path, array):
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def build_cache(columns=DEFAULT_COLUMNS, atlas_path=ATLAS_PATH, cache_dir=CACHE_DIR):
+    """Parse the requested atlas columns once and store them in the binary cache.
+
+    Columns already cached for the same atlas file are not parsed again. Returns the cache index.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    stamp = _source_stamp(atlas_path)
+    index = _read_index(cache_dir)
+    if index is None or index['source'] != stamp:
+        index = {'source': stamp, 'columns': [], 'rows': 0, 'counties': {}}
+    missing = [column for column in columns if column not in index['columns']]
+    if not missing and index['counties']:
+        return index
+
+    # Only the key columns and the missing columns are parsed, with compact dtypes
+    dtypes = {column: _column_dtype(column) for column in missing}
+    dtypes.update({column: str for column in KEY_COLUMNS})
+    atlas = pd.read_csv(atlas_path, usecols=KEY_COLUMNS + missing, dtype=dtypes)
+
+    # A stable sort keeps row order identical for columns added in later calls
+    atlas = atlas.sort_values(KEY_COLUMNS, kind='stable').reset_index(drop=True)
+    for column in missing:
+        _save_atomic(_cache_file(cache_dir, column), atlas[column].to_numpy(dtype=_column_dtype(column)))
+
+    counties = {}
+    bounds = atlas.groupby(KEY_COLUMNS, sort=False).indices
+    for (state, county), rows in bounds.items():
+        counties.setdefault(state, {})[county] = [int(rows[0]), int(rows[-1]) + 1]
+    index.update(rows=len(atlas), counties=counties, columns=index['columns'] + missing)
+
+    tmp_path = os.path.join(cache_dir, 'index.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, os.path.join(cache_dir, 'index.json'))
+    return index
+
+
+def open_columns(columns=DEFAULT_COLUMNS, atlas_path=ATLAS_PATH, cache_dir=CACHE_DIR):
+    """Return the cache index and a read-only memory map of every requested column for the whole atlas."""
+    index = _read_index(cache_dir)
+    if index is None or index['source'] != _source_stamp(atlas_path) or \
+            any(column not in index['columns'] for column in columns):
+        index = build_cache(columns, atlas_path, cache_dir)
+    arrays = {column: np.load(_cache_file(cache_dir, column), mmap_mode='r') for column in columns}
+    return index, arrays
+
+
+def list_counties(atlas_path=ATLAS_PATH, cache_dir=CACHE_DIR):
+    """Return every (State, County) pair in the atlas, in cache order."""
+    index, _ = open_columns([], atlas_path, cache_dir)
+    return [(state, county) for state, counties in index['counties'].items() for county in counties]
+
+
+def csv_types(data):
+    """Return `data` with the float32 cache columns as pandas would read them from the atlas CSV.
+
+    Whole-number columns without NaNs (the counts, e.g. POP2010) become int64 and the rest float64, so output
+    files print "4601" rather than "4601.0" and derived columns are computed in float64.
+    """
+    data = data.copy()
+    for column in data.columns:
+        if data[column].dtype == np.float32:
+            values = data[column].to_numpy(dtype=np.float64)
+            whole = not np.isnan(values).any() and np.array_equal(values, np.round(values))
+            data[column] = values.astype(np.int64) if whole else values
+    return data
+
+
+def load_county(state, county, columns=DEFAULT_COLUMNS, atlas_path=ATLAS_PATH, cache_dir=CACHE_DIR):
+    """Load the given atlas columns for one county as a DataFrame."""
+    index, arrays = open_columns(columns, atlas_path, cache_dir)
+    start, stop = index['counties'].get(state, {}).get(county, (0, 0))
+    return pd.DataFrame({column: np.array(arrays[column][start:stop]) for column in columns})
+
+
+def load_state(state, columns=DEFAULT_COLUMNS, atlas_path=ATLAS_PATH, cache_dir=CACHE_DIR):
+    """Load the given atlas columns for every county of one state, with a County column, as a DataFrame."""
+    index, arrays = open_columns(columns, atlas_path, cache_dir)
+    ranges = index['counties'].get(state, {})
+    if not ranges:
+        return pd.DataFrame({'County': np.empty(0, dtype=object),
+                             **{column: np.empty(0, dtype=_column_dtype(column)) for column in columns}})
+    # Rows are sorted by state and county, so a state's counties are one contiguous block
+    start = min(start for start, _ in ranges.values())
+    stop = max(stop for _, stop in ranges.values())
+    county = np.empty(stop - start, dtype=object)
+    for name, (county_start, county_stop) in ranges.items():
+        county[county_start - start:county_stop - start] = name
+    data = {column: np.array(arrays[column][start:stop]) for column in columns}
+    return pd.DataFrame({'County': county, **data})
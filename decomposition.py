@@ -0,0 +1,297 @@
+"""
+This script allocates one supermarket budget shared by every tract of a state. The adjacency limits only link
+tracts in the same connected component of the (binding part of the) adjacency graph, so the statewide model
+splits into independent blocks of components tied together by the single TotalSupermarketsLimit row.
+
+That row is relaxed with a Lagrange multiplier (a price per supermarket): for a given price every block is
+solved on its own, in parallel worker processes, and the price is bisected until the blocks together place
+the budget. If no price places it exactly, each block gets a budget between its allocations at the two
+closest prices and is solved once more with its budget. The lowest Lagrangian value seen is an upper bound on
+the statewide optimum, so the duality gap of the decomposed allocation is reported, and with --monolithic it
+is also compared with solving the whole state as one model."""
+import argparse
+import dataclasses
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from data_loader import load_state, ATLAS_PATH, CACHE_DIR
+from model_builder import build_model, objective_terms, objective_vector, TOTAL_NEW_SUPERMARKETS, \
+    ADJACENCY_LIMIT, MAX_SUPERMARKETS_PER_TRACT, ALPHA, BETA
+from presolve import solve_presolved
+from solver import SolveOptions, FEASIBLE_STATUSES
+
+SELECTED_COLUMNS = ['CensusTract', 'POP2010', 'TractSNAP', 'MedianFamilyIncome']
+BLOCKS_PER_WORKER = 4
+MAX_ITERATIONS = 60
+PRICE_TOLERANCE = 1e-9
+
+# Block models of the current worker process, set once by the pool initializer
+_blocks = None
+
+
+def binding_edges(edges, max_per_tract, adjacency_limit):
+    """Adjacency pairs whose AdjacencyLimit row can bind; the others never couple their tracts."""
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    return edges if 2 * max_per_tract > adjacency_limit else edges[:0]
+
+
+def split_blocks(num_tracts, edges, num_blocks):
+    """Group the connected components of the edge graph into at most num_blocks blocks of similar size.
+
+    Returns a list of arrays of tract positions; components are never split across blocks.
+    """
+    graph = coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(num_tracts, num_tracts))
+    _, labels = connected_components(graph, directed=False)
+    sizes = np.bincount(labels)
+
+    # Largest components first, each into the currently smallest block
+    loads = np.zeros(max(1, min(num_blocks, len(sizes))), dtype=np.int64)
+    block_of_component = np.empty(len(sizes), dtype=np.int64)
+    for component in np.argsort(-sizes, kind='stable'):
+        block = int(np.argmin(loads))
+        block_of_component[component] = block
+        loads[block] += sizes[component]
+    block_of_tract = block_of_component[labels]
+    order = np.argsort(block_of_tract, kind='stable')
+    return [block for block in np.split(order, np.cumsum(np.bincount(block_of_tract))[:-1]) if len(block)]
+
+
+def block_model(tracts, population, snap, income, edges, positions, terms, adjacency_limit, max_per_tract,
+                alpha, beta):
+    """Model of the tracts at `positions` with the statewide objective and a budget row that never binds."""
+    local = np.full(len(tracts), -1)
+    local[positions] = np.arange(len(positions))
+    block_edges = local[edges]
+    block_edges = block_edges[(block_edges >= 0).all(axis=1)]
+    model = build_model(tracts[positions], population[positions], snap[positions], income[positions],
+                        block_edges, total_supermarkets=len(positions) * max_per_tract,
+                        adjacency_limit=adjacency_limit, max_per_tract=max_per_tract)
+    # The objective is normalised over the whole state, not over the block
+    objective = objective_vector(tuple(term[positions] for term in terms), alpha, beta)
+    sense = model.sense.copy()
+    sense[model.total_row] = 'L'
+    return dataclasses.replace(model, objective=objective, sense=sense)
+
+
+def set_budget(model, budget):
+    """Copy of a block model whose budget row places exactly `budget` supermarkets."""
+    sense = model.sense.copy()
+    rhs = model.rhs.copy()
+    sense[model.total_row] = 'E'
+    rhs[model.total_row] = budget
+    return dataclasses.replace(model, sense=sense, rhs=rhs)
+
+
+def _init_worker(blocks):
+    global _blocks
+    _blocks = blocks
+
+
+def solve_block(block, price, options, budget=None):
+    """Solve one block either at a supermarket price (Lagrangian subproblem) or with its own budget.
+
+    Returns the status, the priced objective, the bound on it, the unpriced objective and the supermarkets.
+    """
+    model = _blocks[block]
+    n = model.num_tracts
+    if budget is None:
+        objective = model.objective.copy()
+        objective[:n] -= price
+        model = dataclasses.replace(model, objective=objective)
+    else:
+        model = set_budget(model, budget)
+    result, _ = solve_presolved(model, options)
+    supermarkets = np.round(result.values[:n])
+    values = np.concatenate([supermarkets, (supermarkets > 0).astype(np.float64)])
+    return result.status, result.objective, result.bound, float(_blocks[block].objective @ values), supermarkets
+
+
+def price_bounds(blocks):
+    """Prices at which every tract, or no tract, is worth a supermarket."""
+    low = min((model.objective[:model.num_tracts] + model.objective[model.num_tracts:2 * model.num_tracts]).min()
+              for model in blocks)
+    high = max(model.objective[:model.num_tracts].max() for model in blocks)
+    return low - 1.0, max(high, 0.0) + 1.0
+
+
+def price_guess(blocks, budget):
+    """The price that places the budget when no adjacency limit binds: between the budget-th and next best tract."""
+    values = np.sort(np.concatenate([
+        np.repeat(model.objective[:model.num_tracts] + model.objective[model.num_tracts:2 * model.num_tracts],
+                  model.upper[:model.num_tracts].astype(np.int64))
+        for model in blocks]))[::-1]
+    if budget <= 0 or budget >= len(values):
+        return None
+    return (values[budget - 1] + values[budget]) / 2
+
+
+def lagrangian_allocation(blocks, budget, workers, options, max_iterations=MAX_ITERATIONS):
+    """Bisect the supermarket price until the blocks place the budget, then recover a feasible allocation.
+
+    Returns the per-block supermarkets, the allocation's objective, the Lagrangian (dual) bound, the number
+    of price iterations and the status.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(blocks,)) as pool:
+        def priced(price):
+            results = list(pool.map(solve_block, range(len(blocks)), [price] * len(blocks),
+                                    [options] * len(blocks)))
+            counts = np.array([result[4].sum() for result in results])
+            bound = price * budget + sum(result[2] for result in results)
+            statuses = {result[0] for result in results}
+            return counts, bound, results, statuses
+
+        low, high = price_bounds(blocks)
+        low_counts, dual_bound, low_results, statuses = priced(low)
+        if low_counts.sum() < budget:
+            raise ValueError(f"the adjacency limits allow at most {int(low_counts.sum())} supermarkets, "
+                             f"fewer than the budget of {budget}")
+        high_counts, high_bound, high_results, _ = priced(high)
+        dual_bound = min(dual_bound, high_bound)
+        iterations = 2
+
+        # Start from the price that would be exact without adjacency limits, which is often already right
+        guess = price_guess(blocks, budget)
+        if guess is not None and low_counts.sum() != budget:
+            counts, bound, results, block_statuses = priced(guess)
+            statuses |= block_statuses
+            dual_bound = min(dual_bound, bound)
+            iterations += 1
+            if counts.sum() >= budget:
+                low, low_counts, low_results = guess, counts, results
+            else:
+                high, high_counts, high_results = guess, counts, results
+
+        # The number of supermarkets placed never increases with the price, so bisect on it
+        while high_counts.sum() != budget and low_counts.sum() != budget and iterations < max_iterations and \
+                high - low > PRICE_TOLERANCE * max(1.0, abs(low), abs(high)):
+            price = (low + high) / 2
+            counts, bound, results, block_statuses = priced(price)
+            statuses |= block_statuses
+            dual_bound = min(dual_bound, bound)
+            iterations += 1
+            if counts.sum() >= budget:
+                low, low_counts, low_results = price, counts, results
+            else:
+                high, high_counts, high_results = price, counts, results
+
+        if not statuses <= set(FEASIBLE_STATUSES):
+            return None, np.nan, dual_bound, iterations, 'NotSolved'
+        if low_counts.sum() == budget or high_counts.sum() == budget:
+            # A price that places exactly the budget solves the statewide model
+            results = low_results if low_counts.sum() == budget else high_results
+            objective = sum(result[3] for result in results)
+            return [result[4] for result in results], objective, dual_bound, iterations, 'Optimal'
+
+        # Give every block its supermarkets at the higher price, then hand out the rest up to its count at the
+        # lower price; fewer supermarkets than a feasible allocation are always feasible
+        room = np.maximum(low_counts - high_counts, 0)
+        remaining = budget - high_counts.sum()
+        block_budgets = high_counts + np.minimum(room, np.maximum(remaining - (np.cumsum(room) - room), 0))
+        results = list(pool.map(solve_block, range(len(blocks)), [0.0] * len(blocks), [options] * len(blocks),
+                                block_budgets.tolist()))
+    status = 'Feasible' if {result[0] for result in results} <= set(FEASIBLE_STATUSES) else 'NotSolved'
+    objective = sum(result[3] for result in results)
+    return [result[4] for result in results], objective, dual_bound, iterations, status
+
+
+def solve_statewide(state_data, edges, budget, workers, options, adjacency_limit=ADJACENCY_LIMIT,
+                    max_per_tract=MAX_SUPERMARKETS_PER_TRACT, alpha=ALPHA, beta=BETA, monolithic=False,
+                    monolithic_options=None):
+    """Decompose and solve the statewide model; optionally also solve it as one model for comparison.
+
+    Returns the supermarkets per tract (in state_data order) and a dict of objectives, bounds and timings.
+    """
+    tracts = state_data['CensusTract'].to_numpy()
+    population = state_data['POP2010'].to_numpy(dtype=np.float64)
+    snap = state_data['TractSNAP'].to_numpy(dtype=np.float64)
+    income = state_data['MedianFamilyIncome'].to_numpy(dtype=np.float64)
+    terms = objective_terms(population, snap, income)
+
+    start = time.perf_counter()
+    positions = split_blocks(len(tracts), binding_edges(edges, max_per_tract, adjacency_limit),
+                             workers * BLOCKS_PER_WORKER)
+    blocks = [block_model(tracts, population, snap, income, edges, block, terms, adjacency_limit, max_per_tract,
+                          alpha, beta) for block in positions]
+    supermarkets, objective, dual_bound, iterations, status = \
+        lagrangian_allocation(blocks, budget, workers, options)
+    allocation = np.zeros(len(tracts))
+    if supermarkets is not None:
+        for block, block_supermarkets in zip(positions, supermarkets):
+            allocation[block] = block_supermarkets
+    report = {
+        'tracts': len(tracts),
+        'blocks': len(blocks),
+        'largest_block': max((len(block) for block in positions), default=0),
+        'status': status,
+        'objective': objective,
+        'dual_bound': float(dual_bound),
+        'duality_gap': float(abs(dual_bound - objective) / max(abs(objective), 1e-9)),
+        'iterations': iterations,
+        'seconds': time.perf_counter() - start,
+    }
+
+    if monolithic:
+        start = time.perf_counter()
+        model = build_model(tracts, population, snap, income, edges, total_supermarkets=budget,
+                            adjacency_limit=adjacency_limit, max_per_tract=max_per_tract, alpha=alpha, beta=beta)
+        result, _ = solve_presolved(model, monolithic_options or SolveOptions())
+        report.update({
+            'monolithic_status': result.status,
+            'monolithic_objective': result.objective,
+            'monolithic_seconds': time.perf_counter() - start,
+            # How far the decomposed allocation, and the Lagrangian bound, are from the monolithic optimum
+            'gap_to_monolithic': abs(result.objective - objective) / max(abs(result.objective), 1e-9),
+            'bound_gap_to_monolithic': float(abs(dual_bound - result.objective) / max(abs(result.objective), 1e-9)),
+        })
+    return allocation, report
+
+
+if __name__ == '__main__':
+    from adjacency import load_adjacency, edges_for_tracts
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--state', default='California')
+    parser.add_argument('--budget', type=int, default=TOTAL_NEW_SUPERMARKETS, help="supermarkets for the whole state")
+    parser.add_argument('--adjacency-limit', type=int, default=ADJACENCY_LIMIT)
+    parser.add_argument('--max-per-tract', type=int, default=MAX_SUPERMARKETS_PER_TRACT)
+    parser.add_argument('--alpha', type=float, default=ALPHA)
+    parser.add_argument('--beta', type=float, default=BETA)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--time-limit', type=float, help="CBC time limit per block solve, in seconds")
+    parser.add_argument('--gap', type=float, help="relative MIP gap for each block solve")
+    parser.add_argument('--monolithic', action='store_true', help="also solve the state as one model and compare")
+    parser.add_argument('--atlas', default=ATLAS_PATH)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--adjacency', default='adjacency_csr', help="CSR adjacency directory covering the state")
+    parser.add_argument('--output', default='statewide_allocation.csv')
+    args = parser.parse_args()
+
+    state_data = load_state(args.state, SELECTED_COLUMNS, args.atlas, args.cache_dir)
+    state_data = state_data.dropna(subset=SELECTED_COLUMNS).reset_index(drop=True)
+    if os.path.isdir(args.adjacency):
+        edges = edges_for_tracts(load_adjacency(args.adjacency), state_data['CensusTract'])
+    else:
+        edges = np.empty((0, 2), dtype=np.int64)
+
+    options = SolveOptions(threads=1, time_limit=args.time_limit, gap_rel=args.gap)
+    monolithic_options = SolveOptions(threads=args.workers, time_limit=args.time_limit, gap_rel=args.gap)
+    allocation, report = solve_statewide(state_data, edges, args.budget, args.workers, options,
+                                         args.adjacency_limit, args.max_per_tract, args.alpha, args.beta,
+                                         args.monolithic, monolithic_options)
+
+    print(f"{args.state}: {report['tracts']} tracts in {report['blocks']} blocks (largest {report['largest_block']})")
+    print(f"Decomposed: {report['status']}, objective {report['objective']}, Lagrangian bound {report['dual_bound']}, "
+          f"duality gap {report['duality_gap']:.2e}, {report['iterations']} price iterations, {report['seconds']:.2f}s")
+    if args.monolithic:
+        print(f"Monolithic: {report['monolithic_status']}, objective {report['monolithic_objective']}, "
+              f"{report['monolithic_seconds']:.2f}s; decomposed allocation within {report['gap_to_monolithic']:.2e}, "
+              f"Lagrangian bound within {report['bound_gap_to_monolithic']:.2e}")
+
+    state_data['Assigned_Supermarkets'] = allocation
+    state_data.to_csv(args.output, index=False)
+    print(f"Statewide allocation saved to: {args.output}")
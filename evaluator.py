@@ -0,0 +1,111 @@
+"""
+This module scores many supermarket allocations at once. Allocations are rows of an (allocations x tracts)
+matrix scored against one shared set of tract attributes, so all five metrics from evaluation_main.py are
+computed for every row with a few matrix reductions, one chunk of rows at a time."""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+METRICS = ['low_income_coverage', 'population_coverage', 'geographic_coverage', 'combined_coverage',
+           'income_balance']
+CHUNK_SIZE = 65536
+
+
+def tract_attributes(data):
+    """Per-tract arrays the metrics need, from a DataFrame in the assigned_supermarkets.csv format.
+
+    Suppressed (NaN) atlas values count as zero SNAP households or population and are left out of the income
+    statistics through `income_valid`, as pandas' NaN-skipping sums and means did in evaluation_main.py.
+    """
+    income = data['MedianFamilyIncome'].to_numpy(dtype=np.float64) if 'MedianFamilyIncome' in data else \
+        np.full(len(data), np.nan)
+    valid = ~np.isnan(income)
+    # Centering income first keeps the variance computed from sums of squares accurate
+    centered = np.where(valid, income - income[valid].mean(), 0.0) if valid.any() else np.zeros(len(income))
+    return {
+        'snap': np.nan_to_num(data['TractSNAP'].to_numpy(dtype=np.float64)),
+        'population': np.nan_to_num(data['POP2010'].to_numpy(dtype=np.float64)),
+        'income': centered,
+        'income_squared': centered ** 2,
+        'income_valid': valid.astype(np.float64),
+    }
+
+
+def evaluate_chunk(allocations, attributes, alpha=0.4, beta=0.4, gamma=0.2):
+    """All metrics for each row of one (rows x tracts) allocation chunk."""
+    served = (np.asarray(allocations) > 0).astype(np.float64)
+    num_tracts = served.shape[1]
+    served_tracts = served.sum(axis=1)
+
+    # Metric 1 and 2: percent of SNAP households and population in tracts with a supermarket
+    low_income = 100 * (served @ attributes['snap']) / attributes['snap'].sum()
+    population = 100 * (served @ attributes['population']) / attributes['population'].sum()
+
+    # Metric 5: percent of tracts with a supermarket
+    geographic = 100 * served_tracts / num_tracts if num_tracts else np.zeros(len(served))
+
+    # Metric 3: weighted combination of the three coverages
+    combined = alpha * low_income + beta * population + gamma * geographic
+
+    # Metric 4: variance of MedianFamilyIncome over the served tracts with a known income, NaN when there are none
+    income_tracts = served @ attributes['income_valid']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (served @ attributes['income']) / income_tracts
+        variance = (served @ attributes['income_squared']) / income_tracts - mean ** 2
+
+    return {
+        'low_income_coverage': low_income,
+        'population_coverage': population,
+        'geographic_coverage': geographic,
+        'combined_coverage': combined,
+        'income_balance': variance,
+    }
+
+
+def evaluate_stream(chunks, attributes, alpha=0.4, beta=0.4, gamma=0.2):
+    """Yield the metrics of every chunk from an iterable of allocation chunks."""
+    for chunk in chunks:
+        yield evaluate_chunk(chunk, attributes, alpha, beta, gamma)
+
+
+def evaluate(allocations, attributes, alpha=0.4, beta=0.4, gamma=0.2, chunk_size=CHUNK_SIZE):
+    """Metrics of every row of an allocation matrix (or memory map), scored chunk_size rows at a time."""
+    allocations = np.atleast_2d(allocations)
+    chunks = (allocations[start:start + chunk_size] for start in range(0, len(allocations), chunk_size))
+    results = list(evaluate_stream(chunks, attributes, alpha, beta, gamma))
+    if not results:
+        return {metric: np.empty(0) for metric in METRICS}
+    return {metric: np.concatenate([result[metric] for result in results]) for metric in METRICS}
+
+
+def within_radius_coverage(allocations, within, weights):
+    """Percent of the weight in tracts with a supermarket within the radius, for each allocation row.
+
+    `within` is the sparse (tracts x tracts) matrix from coverage.coverage_matrix.
+    """
+    served = (np.atleast_2d(allocations) > 0).astype(np.float64)
+    reached = (within @ served.T).T > 0
+    return 100 * (reached @ weights) / weights.sum()
+
+
+def allocation_matrix(frames, tracts):
+    """Stack the Assigned_Supermarkets columns of several result files in the tract order of `tracts`."""
+    return np.vstack([
+        frame.set_index('CensusTract')['Assigned_Supermarkets'].reindex(tracts).fillna(0).to_numpy()
+        for frame in frames
+    ])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('allocations', help=".npy file of an (allocations x tracts) matrix")
+    parser.add_argument('--data', default='assigned_supermarkets.csv', help="tract attributes, in the matrix's tract order")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--output', default='evaluation_results.csv')
+    args = parser.parse_args()
+
+    attributes = tract_attributes(pd.read_csv(args.data))
+    metrics = evaluate(np.load(args.allocations, mmap_mode='r'), attributes, chunk_size=args.chunk_size)
+    pd.DataFrame(metrics).to_csv(args.output, index=False)
+    print(f"Evaluation results saved to: {args.output}")
@@ -0,0 +1,441 @@
+"""
+This module is a fast alternative to CBC for the model_builder.py allocation model. The objective is separable
+per tract (coverage score per supermarket, income penalty for the tract's first one), so a greedy pass takes
+supermarkets in order of their marginal value from a lazy priority queue, skipping any that would break an
+AdjacencyLimit or MAX_SUPERMARKETS_PER_TRACT, until the budget is placed. When tight adjacency limits leave
+greedy short of the budget, a repair step swaps one supermarket for two tracts it was blocking (forcing in
+a blocked tract when no such swap exists). Local search then moves single supermarkets to better tracts,
+including into a tract that only a neighbor's supermarket was blocking, and makes the same one-for-two swap
+while giving up the cheapest supermarket elsewhere. Local search stops at a local optimum, so the answer is
+not always optimal; its gap to the bound says how close it is.
+
+Speed depends on whether the adjacency limits bind. When they cannot (e.g. MAX_SUPERMARKETS_PER_TRACT = 1
+and ADJACENCY_LIMIT = 6) greedy is exact and 100,000 tracts take well under a second. When they do, every
+repair or local search step costs O(tracts), so both stop after TIME_LIMIT seconds (100,000 tracts with
+ADJACENCY_LIMIT = 1 and a budget of 20,000 take the full 5 s).
+
+Every answer comes with an LP relaxation's objective as an upper bound, so the gap to the optimum is known:
+when no adjacency limit can bind the LP is solved in closed form, otherwise by CBC with `relax=True` up to
+LP_MAX_ROWS binding rows. Beyond that the bound is solved in closed form without the adjacency rows, which
+with tight limits can be very loose (gaps of 50-90% that say little about the allocation)."""
+import argparse
+import heapq
+import time
+
+import numpy as np
+
+from solver import SolveResult
+
+MAX_SWAPS = 10000
+BLOCKED_CANDIDATES = 32   # blocked tracts tried per local search step
+IMPROVEMENT_TOLERANCE = 1e-9
+TIME_LIMIT = 5.0          # seconds for repair and local search; each step costs O(tracts)
+LP_MAX_ROWS = 10000       # binding AdjacencyLimit rows up to which CBC solves the full LP relaxation
+
+
+class AdjacencySlack:
+    """Remaining room, limit - x_a - x_b, on every binding AdjacencyLimit row, kept up to date per tract."""
+
+    def __init__(self, model, supermarkets):
+        n = model.num_tracts
+        upper = model.upper[:n]
+        limits = model.rhs[model.adjacency_rows]
+        binding = upper[model.edges[:, 0]] + upper[model.edges[:, 1]] > limits
+        self.edges = model.edges[binding]
+        self.slack = limits[binding] - supermarkets[self.edges[:, 0]] - supermarkets[self.edges[:, 1]]
+
+        # Incident binding rows of every tract, in CSR form
+        ends = np.concatenate([self.edges[:, 0], self.edges[:, 1]])
+        order = np.argsort(ends, kind='stable')
+        self.incident = np.concatenate([np.arange(len(self.edges))] * 2)[order]
+        self.owner = ends[order]
+        self.other = np.concatenate([self.edges[:, 1], self.edges[:, 0]])[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(ends, minlength=n))])
+        self.min_slack = np.full(n, np.inf)
+        has_rows = np.diff(self.offsets) > 0
+        if has_rows.any():
+            self.min_slack[has_rows] = np.minimum.reduceat(self.slack[self.incident], self.offsets[:-1][has_rows])
+
+    @property
+    def binding(self):
+        return len(self.edges) > 0
+
+    def _refresh(self, tract):
+        rows = self.incident[self.offsets[tract]:self.offsets[tract + 1]]
+        self.min_slack[tract] = self.slack[rows].min() if len(rows) else np.inf
+
+    def change(self, tract, delta):
+        """Account for `delta` supermarkets added to (or removed from) a tract."""
+        start, stop = self.offsets[tract], self.offsets[tract + 1]
+        if start == stop:
+            return
+        self.slack[self.incident[start:stop]] -= delta
+        self._refresh(tract)
+        for neighbor in self.other[start:stop]:
+            self._refresh(neighbor)
+
+    def single_blockers(self, supermarkets, upper):
+        """(tracts, blockers): tracts below their cap whose one full AdjacencyLimit row is shared with a
+        blocker that has a supermarket to give up, so the tract opens when the blocker loses one."""
+        full = np.flatnonzero(self.slack[self.incident] < 1)
+        count = np.bincount(self.owner[full], minlength=len(supermarkets))
+        tracts, blockers = self.owner[full], self.other[full]
+        keep = (count[tracts] == 1) & (supermarkets[tracts] < upper[tracts]) & (supermarkets[blockers] > 0)
+        return tracts[keep], blockers[keep]
+
+    def least_blocked(self, supermarkets, upper):
+        """(tracts, blockers) of every tract below its cap that opens when each of its fewest blocking
+        neighbors gives up one supermarket; tracts repeat once per blocker."""
+        full = np.flatnonzero(self.slack[self.incident] < 1)
+        tracts, blockers = self.owner[full], self.other[full]
+        n = len(supermarkets)
+        count = np.bincount(tracts, minlength=n)
+        stuck = np.bincount(tracts[supermarkets[blockers] == 0], minlength=n) > 0
+        forcible = (count > 0) & ~stuck & (supermarkets < upper)
+        if not forcible.any():
+            return tracts[:0], blockers[:0]
+        keep = forcible[tracts] & (count[tracts] == count[forcible].min())
+        return tracts[keep], blockers[keep]
+
+
+def _model_parts(model):
+    if model.covering:
+        raise ValueError("the heuristic does not support the maximal covering objective")
+    n = model.num_tracts
+    coverage = model.objective[:n]
+    penalty = model.objective[n:2 * n] if model.indicators else np.zeros(n)
+    upper = np.round(model.upper[:n]).astype(np.int64)
+    budget = int(round(model.rhs[model.total_row]))
+    return coverage, penalty, upper, budget
+
+
+def allocation_objective(model, supermarkets):
+    coverage, penalty, _, _ = _model_parts(model)
+    return float(coverage @ supermarkets + penalty @ (supermarkets > 0))
+
+
+def greedy_allocation(model):
+    """Place the budget tract by tract, best value per supermarket first, respecting every limit.
+
+    A tract is valued as if it received as many supermarkets as it still has room for, so the income penalty
+    of its first one is spread over all of them. Returns the supermarkets per tract and the adjacency slack
+    tracker; fewer than the budget are placed only when the limits leave no room.
+    """
+    coverage, penalty, upper, budget = _model_parts(model)
+    n = model.num_tracts
+    supermarkets = np.zeros(n)
+    slack = AdjacencySlack(model, supermarkets)
+    first = coverage + penalty
+
+    if not slack.binding and (upper == 1).all():
+        # Nothing interacts, so the best `budget` tracts are the optimum
+        chosen = np.argpartition(-first, budget - 1)[:budget] if 0 < budget <= n else \
+            np.arange(n)[:max(budget, 0)]
+        supermarkets[chosen] = 1
+        return supermarkets, slack
+
+    def offer(tract, remaining):
+        """Supermarkets the tract can still take and their value per supermarket."""
+        room = min(upper[tract] - supermarkets[tract], slack.min_slack[tract], remaining)
+        if room < 1:
+            return 0, -np.inf
+        room = int(room)
+        return room, coverage[tract] + (penalty[tract] if supermarkets[tract] == 0 else 0.0) / room
+
+    # Offers only get worse as neighbors and the budget fill up, so a popped offer that is still current is the
+    # best one (a lazy priority queue); a stale one is pushed back with its new value
+    room = np.minimum(np.minimum(upper, slack.min_slack), budget)
+    offered = np.flatnonzero(room >= 1)
+    heap = list(zip((-(coverage + penalty / np.maximum(room, 1)))[offered].tolist(), offered.tolist()))
+    heapq.heapify(heap)
+    placed = 0
+    while placed < budget and heap:
+        value, tract = heapq.heappop(heap)
+        room, current = offer(tract, budget - placed)
+        if room == 0:
+            continue
+        if current < -value - IMPROVEMENT_TOLERANCE * max(1.0, abs(value)):
+            heapq.heappush(heap, (-current, tract))
+            continue
+        supermarkets[tract] += room
+        slack.change(tract, room)
+        placed += room
+        room, current = offer(tract, budget - placed)
+        if room:
+            heapq.heappush(heap, (-current, tract))
+    return supermarkets, slack
+
+
+def local_search(model, supermarkets, slack, max_swaps=MAX_SWAPS, deadline=np.inf):
+    """Move supermarkets while that improves the objective; returns the number of moves made.
+
+    A move either takes one supermarket from one tract to another (also into a tract that only a neighbor's
+    supermarket was blocking), relocates all k supermarkets of a tract to an empty tract with room for k, or
+    gives up a blocking supermarket and the cheapest other one for two tracts that the blocker kept out.
+    """
+    coverage, penalty, upper, _ = _model_parts(model)
+    first = coverage + penalty
+    moves = 0
+    while moves < max_swaps and time.perf_counter() < deadline:
+        add_value = np.where(supermarkets == 0, first, coverage)
+        remove_value = np.where(supermarkets == 1, first, coverage)
+        removable = supermarkets > 0
+        if not removable.any():
+            break
+
+        # Cheapest supermarket to give up, moved to the best tract that has room for it
+        source = int(np.argmin(np.where(removable, remove_value, np.inf)))
+        open_value = np.where((supermarkets < upper) & (slack.min_slack >= 1), add_value, -np.inf)
+        open_value[source] = -np.inf
+        target = int(np.argmax(open_value))
+        best = (open_value[target] - remove_value[source], [(source, -1), (target, 1)])
+
+        # A blocked tract opens when its only blocking neighbor gives up a supermarket
+        if slack.binding:
+            tracts, blockers = slack.single_blockers(supermarkets, upper)
+            if len(tracts):
+                gains = add_value[tracts] - remove_value[blockers]
+                i = int(np.argmax(gains))
+                if gains[i] > best[0]:
+                    best = (gains[i], [(int(blockers[i]), -1), (int(tracts[i]), 1)])
+
+                # A blocker that keeps out two tracts can give up its supermarket for both, paid for by the
+                # cheapest supermarket elsewhere; the most promising few are checked against the slack
+                cheapest = remove_value[removable].min()
+                for blocker, tract, estimate in blocker_pairs(tracts, blockers, add_value, remove_value,
+                                                              BLOCKED_CANDIDATES):
+                    if estimate - cheapest <= best[0]:
+                        break
+                    pair = blocker_swap(supermarkets, slack, add_value, remove_value, coverage, upper,
+                                        blocker, tract, target)
+                    if pair is not None and pair[0] > best[0]:
+                        best = pair
+
+        # Relocating a whole tract's supermarkets moves its income penalty too
+        if (upper > 1).any():
+            room = np.minimum(upper, slack.min_slack)
+            for count in np.unique(supermarkets[supermarkets > 1]).astype(np.int64):
+                tract_value = count * coverage + penalty
+                source = int(np.argmin(np.where(supermarkets == count, tract_value, np.inf)))
+                target_value = np.where((supermarkets == 0) & (room >= count), tract_value, -np.inf)
+                target = int(np.argmax(target_value))
+                gain = target_value[target] - tract_value[source]
+                if gain > best[0]:
+                    best = (gain, [(source, -count), (target, count)])
+
+        gain, changes = best
+        if not gain > IMPROVEMENT_TOLERANCE * max(1.0, abs(allocation_objective(model, supermarkets))):
+            break
+        for tract, delta in changes:
+            supermarkets[tract] += delta
+            slack.change(tract, delta)
+        moves += 1
+    return moves
+
+
+def fill_budget(model, supermarkets, slack, max_moves=MAX_SWAPS, deadline=np.inf, seed=0):
+    """Place the supermarkets greedy could not, when the adjacency limits left no tract with room.
+
+    Each step adds to the best open tract, or else takes a supermarket from a blocker and adds one to each
+    of two tracts it alone kept out. When neither is possible, a random tract among the least blocked is
+    forced in by taking a supermarket from each of its blockers, which sets up new steps of the first two kinds
+    (as in iterated local search for independent sets). The allocation with the most supermarkets placed
+    is kept. Returns the number of steps.
+    """
+    coverage, penalty, upper, budget = _model_parts(model)
+    first = coverage + penalty
+    rng = np.random.default_rng(seed)
+    best = supermarkets.copy()
+    moves = 0
+    while supermarkets.sum() < budget and moves < max_moves and time.perf_counter() < deadline:
+        add_value = np.where(supermarkets == 0, first, coverage)
+        remove_value = np.where(supermarkets == 1, first, coverage)
+        open_value = np.where((supermarkets < upper) & (slack.min_slack >= 1), add_value, -np.inf)
+        target = int(np.argmax(open_value))
+        changes = [(target, 1)] if np.isfinite(open_value[target]) else None
+        if changes is None and slack.binding:
+            tracts, blockers = slack.single_blockers(supermarkets, upper)
+            for blocker, tract, _ in blocker_pairs(tracts, blockers, add_value, remove_value):
+                pair = blocker_pair(supermarkets, slack, add_value, remove_value, coverage, upper, blocker, tract,
+                                    target)
+                if pair is not None:
+                    changes = pair[1]
+                    break
+        if changes is None and slack.binding:
+            tracts, blockers = slack.least_blocked(supermarkets, upper)
+            if len(tracts):
+                tract = int(rng.choice(tracts))
+                changes = [(int(blocker), -1) for blocker in blockers[tracts == tract]] + [(tract, 1)]
+        if changes is None:
+            break
+        for tract, delta in changes:
+            supermarkets[tract] += delta
+            slack.change(tract, delta)
+        moves += 1
+        if supermarkets.sum() > best.sum():
+            best = supermarkets.copy()
+
+    for tract in np.flatnonzero(best != supermarkets):
+        slack.change(tract, best[tract] - supermarkets[tract])
+        supermarkets[tract] = best[tract]
+    return moves
+
+
+def blocker_pairs(tracts, blockers, add_value, remove_value, limit=None):
+    """(blocker, tract, estimate) for every blocker that alone keeps out at least two tracts, best first.
+
+    `tracts` and `blockers` come from AdjacencySlack.single_blockers; the estimate is the value of the
+    blocker's two best blocked tracts less its own supermarket, before checking the two fit together.
+    """
+    order = np.lexsort((-add_value[tracts], blockers))
+    tracts, blockers = tracts[order], blockers[order]
+    pairs = np.flatnonzero(blockers[1:] == blockers[:-1])
+    pairs = pairs[np.r_[True, blockers[pairs[1:]] != blockers[pairs[:-1]]]] if len(pairs) else pairs
+    estimate = add_value[tracts[pairs]] + add_value[tracts[pairs + 1]] - remove_value[blockers[pairs]]
+    for k in np.argsort(-estimate)[:limit]:
+        yield int(blockers[pairs[k]]), int(tracts[pairs[k]]), estimate[k]
+
+
+def blocker_pair(supermarkets, slack, add_value, remove_value, coverage, upper, blocker, tract, target):
+    """Best (gain, changes) that takes a supermarket from `blocker` and adds one to the `tract` it blocked and one
+    to a second tract; None if there is no such move.
+
+    The second tract is a neighbor of the blocker or the best open tract `target`, checked against the slack
+    as it would be after the first two changes.
+    """
+    slack.change(blocker, -1)
+    supermarkets[blocker] -= 1
+    slack.change(tract, 1)
+    supermarkets[tract] += 1
+    start, stop = slack.offsets[blocker], slack.offsets[blocker + 1]
+    seconds = np.unique(np.append(slack.other[start:stop], target))
+    seconds = seconds[(seconds != blocker) & (supermarkets[seconds] < upper[seconds]) &
+                      (slack.min_slack[seconds] >= 1)]
+    supermarkets[tract] -= 1
+    slack.change(tract, -1)
+    supermarkets[blocker] += 1
+    slack.change(blocker, 1)
+    if not len(seconds):
+        return None
+    # Adding a second supermarket to `tract` itself is worth its coverage only
+    second_value = np.where(seconds == tract, coverage[seconds], add_value[seconds])
+    second = int(seconds[np.argmax(second_value)])
+    return add_value[tract] + second_value.max() - remove_value[blocker], [(blocker, -1), (tract, 1), (second, 1)]
+
+
+def blocker_swap(supermarkets, slack, add_value, remove_value, coverage, upper, blocker, tract, target):
+    """blocker_pair, plus removing the cheapest other supermarket to stay on budget."""
+    pair = blocker_pair(supermarkets, slack, add_value, remove_value, coverage, upper, blocker, tract, target)
+    if pair is None:
+        return None
+    gain, changes = pair
+    second = changes[2][0]
+    removable = np.flatnonzero(supermarkets > 0)
+    others = removable[(removable != blocker) & (removable != tract) & (removable != second)]
+    if not len(others):
+        return None
+    cheapest = int(others[np.argmin(remove_value[others])])
+    return gain - remove_value[cheapest], changes + [(cheapest, -1)]
+
+
+def budget_bound(model):
+    """Objective of the LP relaxation without the AdjacencyLimit rows, solved in closed form.
+
+    Only the budget couples tracts then: in the LP has_supermarket = supermarkets / cap, so each of a tract's
+    supermarkets is worth the same and the best `budget` of them give the optimum.
+    """
+    coverage, penalty, upper, budget = _model_parts(model)
+    value = coverage + np.minimum(penalty, 0) / np.maximum(upper, 1)
+    order = np.argsort(-value, kind='stable')
+    units = np.minimum(upper[order], np.maximum(budget - np.concatenate([[0], np.cumsum(upper[order])[:-1]]), 0))
+    if units.sum() < budget:
+        return -np.inf  # the LP is infeasible, and so is the model
+    return float(value[order] @ units + np.maximum(penalty, 0).sum())
+
+
+def lp_bound(model, options=None, max_rows=LP_MAX_ROWS):
+    """An upper bound on the best allocation from the LP relaxation.
+
+    When no AdjacencyLimit row can bind this is budget_bound. Otherwise CBC solves the LP relaxation if it
+    has at most max_rows binding rows; beyond that budget_bound is returned, which is still valid but ignores
+    the adjacency limits, so with tight limits it can be far above the optimum. -inf proves the model infeasible.
+    """
+    _, _, upper, _ = _model_parts(model)
+    limits = model.rhs[model.adjacency_rows]
+    binding = int((upper[model.edges[:, 0]] + upper[model.edges[:, 1]] > limits).sum())
+    if binding == 0 or binding > max_rows:
+        return budget_bound(model)
+
+    from model_builder import solve_model
+
+    result = solve_model(model, options, relax=True)
+    if result.status == 'Infeasible':
+        return -np.inf
+    return result.objective if result.status == 'Optimal' else np.nan
+
+
+def solve_heuristic(model, max_swaps=MAX_SWAPS, bound=True, options=None, time_limit=TIME_LIMIT):
+    """Greedy allocation, repair and local search, returned as a solver.SolveResult with the LP bound and gap.
+
+    The status is Infeasible only when the bound proves it; when the heuristic places fewer supermarkets than
+    the budget otherwise, it is NotSolved (CBC may still find an allocation).
+    """
+    start = time.perf_counter()
+    deadline = start + time_limit if time_limit else np.inf
+    _, _, _, budget = _model_parts(model)
+    supermarkets, slack = greedy_allocation(model)
+    moves = fill_budget(model, supermarkets, slack, max_swaps, deadline)
+    moves += local_search(model, supermarkets, slack, max_swaps, deadline)
+    objective = allocation_objective(model, supermarkets)
+    upper_bound = lp_bound(model, options) if bound else np.nan
+
+    feasible = supermarkets.sum() == budget
+    gap = abs(upper_bound - objective) / max(abs(objective), 1e-9) if feasible else np.nan
+    if not feasible:
+        status = 'Infeasible' if upper_bound == -np.inf else 'NotSolved'
+    else:
+        status = 'Optimal' if gap <= IMPROVEMENT_TOLERANCE else 'Feasible'
+    values = np.concatenate([supermarkets, (supermarkets > 0).astype(np.float64)] if model.indicators
+                            else [supermarkets])
+    # nodes holds the number of repair and local search moves, the heuristic's counterpart of CBC's nodes
+    return SolveResult(status, objective, upper_bound, gap, time.perf_counter() - start, moves, values)
+
+
+if __name__ == '__main__':
+    from model_builder import build_model, TOTAL_NEW_SUPERMARKETS, ADJACENCY_LIMIT, MAX_SUPERMARKETS_PER_TRACT
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--synthetic', type=int, help="solve a synthetic county with this many tracts instead")
+    parser.add_argument('--budget', type=int, default=TOTAL_NEW_SUPERMARKETS)
+    parser.add_argument('--adjacency-limit', type=int, default=ADJACENCY_LIMIT)
+    parser.add_argument('--max-per-tract', type=int, default=MAX_SUPERMARKETS_PER_TRACT)
+    parser.add_argument('--max-swaps', type=int, default=MAX_SWAPS)
+    parser.add_argument('--time-limit', type=float, default=TIME_LIMIT, help="seconds for repair and local search")
+    parser.add_argument('--cbc', action='store_true', help="also solve with CBC to compare")
+    parser.add_argument('--output', help="write the allocation in the assigned_supermarkets.csv format")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from synthetic import synthetic_frame
+        data, edges = synthetic_frame(args.synthetic)
+    else:
+        from adjacency import load_adjacency, edges_for_tracts
+        from data_loader import load_county
+        data = load_county('California', 'Imperial', ['CensusTract', 'POP2010', 'TractSNAP', 'MedianFamilyIncome'])
+        edges = edges_for_tracts(load_adjacency(), data['CensusTract'])
+
+    model = build_model(data['CensusTract'], data['POP2010'], data['TractSNAP'], data['MedianFamilyIncome'], edges,
+                        total_supermarkets=args.budget, adjacency_limit=args.adjacency_limit,
+                        max_per_tract=args.max_per_tract)
+    result = solve_heuristic(model, args.max_swaps, time_limit=args.time_limit)
+    print(f"Heuristic: {result.status}, objective {result.objective}, LP bound {result.bound}, gap {result.gap:.2e}, "
+          f"{result.nodes} moves, {result.wall_time:.3f}s")
+    if args.cbc:
+        from presolve import solve_presolved
+        cbc, _ = solve_presolved(model)
+        print(f"CBC: {cbc.status}, objective {cbc.objective}, {cbc.wall_time:.3f}s")
+
+    if args.output:
+        data['Assigned_Supermarkets'] = result.values[:model.num_tracts]
+        data.to_csv(args.output, index=False)
+        print(f"Supermarket allocation results saved to: {args.output}")
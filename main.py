@@ -2,30 +2,24 @@
 This script demonstrates how to use linear programming to optimize the allocation of supermarkets 
 in Imperial County, California.
 """
-import pandas as pd
-from pulp import LpProblem, LpVariable, LpInteger, LpMaximize, lpSum, PULP_CBC_CMD, LpBinary
+from pulp import LpProblem, LpVariable, LpInteger, LpMaximize, lpSum, LpBinary
 import numpy as np
-import json
-<<<<<<< Updated upstream
-=======
-import geopandas as gpd
-import matplotlib.pyplot as plt
->>>>>>> Stashed changes
+import os
+from data_loader import load_county, csv_types
+from adjacency import load_adjacency, edges_for_tracts
+from solver import SolveOptions, solve_problem, FEASIBLE_STATUSES
+from model_builder import build_model, write_mps
+from presolve import presolve
+from profiling import Profiler
 
-# Load the provided data
-file_path = 'data/food_access_research_atlas.csv'
-food_data = pd.read_csv(file_path)
+profiler = Profiler(script='main') # writes per-stage timings when the PROFILE_FILE environment variable is set
 
-adjacency_file_path = 'adjacency.json'
-with open(adjacency_file_path, 'r') as f:
-    adjacency = json.load(f)
+adjacency = load_adjacency('adjacency_csr')
 
-# Filter data for Imperial County, California
-imperial_county_data = food_data[(food_data['County'] == 'Imperial') & (food_data['State'] == 'California')]
-
-# Select relevant columns for supermarket allocation baseline
+# Load the relevant columns for Imperial County, California
 selected_columns = ['CensusTract', 'POP2010', 'TractSNAP', 'MedianFamilyIncome']
-imperial_county_data = imperial_county_data[selected_columns]
+imperial_county_data = load_county('California', 'Imperial', selected_columns)
+profiler.lap('load', tracts=len(imperial_county_data))
 
 # Define constants
 TOTAL_NEW_SUPERMARKETS = 30
@@ -34,6 +28,28 @@ MEDIAN_INCOME_THRESHOLD = 30000 # median income for poverty threshold
 MAX_SUPERMARKETS_PER_TRACT = 1
 ALPHA = 0.7 # weight for low-income household coverage
 BETA = 0.3  # weight for population coverage
+COVERAGE_RADIUS_MILES = None # set (e.g. 1 or 10) to credit coverage to every tract with a supermarket within this radius
+
+# Solver settings
+SOLVER = 'cbc' # or 'heuristic' for the sub-second greedy + local search allocation with an LP bound (heuristic.py)
+SOLVER_THREADS = os.cpu_count()
+SOLVER_TIME_LIMIT = None # seconds; on large counties a good solution fast matters more than proving optimality
+SOLVER_GAP = None # relative MIP gap to stop at, e.g. 0.01
+WARM_START_FILE = None # previous allocation to start from, e.g. 'assigned_supermarkets.csv'
+DEBUG_LP_FILE = None # e.g. 'debugLP.lp' to dump the model
+DEBUG_MPS_FILE = None
+SCRATCH_DIR = None # directory for CBC's temporary files
+RENDER_MAPS = False # re-render the maps whose inputs changed (see render.py) after solving
+
+# The heuristic has no covering objective and none of CBC's warm start, limits or LP dump
+if SOLVER == 'heuristic':
+    unsupported = [name for name, value in [('COVERAGE_RADIUS_MILES', COVERAGE_RADIUS_MILES),
+                                            ('SOLVER_TIME_LIMIT', SOLVER_TIME_LIMIT), ('SOLVER_GAP', SOLVER_GAP),
+                                            ('WARM_START_FILE', WARM_START_FILE), ('DEBUG_LP_FILE', DEBUG_LP_FILE),
+                                            ('SCRATCH_DIR', SCRATCH_DIR)] if value]
+    if unsupported:
+        raise ValueError(f"SOLVER = 'heuristic' does not support {', '.join(unsupported)}; unset them or use "
+                         f"SOLVER = 'cbc' (DEBUG_MPS_FILE works with both)")
 
 # Prepare data for optimization
 tracts = imperial_county_data['CensusTract'].tolist()
@@ -41,11 +57,8 @@ population = dict(zip(tracts, imperial_county_data['POP2010']))
 low_income_households = dict(zip(tracts, imperial_county_data['TractSNAP']))
 median_income = dict(zip(tracts, imperial_county_data['MedianFamilyIncome']))
 
-# Adjust adjacency keys
-adjacency = {
-    tract[1:]: [neighbor[1:] for neighbor in neighbors]
-    for tract, neighbors in adjacency.items()
-}
+# Adjacent pairs of tracts, as positions into `tracts`
+edges = edges_for_tracts(adjacency, tracts)
 
 # Normalize keys
 tracts = [str(tract) for tract in tracts]
@@ -53,107 +66,130 @@ low_income_households = {str(k): v for k, v in low_income_households.items()}
 population = {str(k): v for k, v in population.items()}
 median_income = {str(k): v for k, v in median_income.items()}
 
-# Define the problem
-problem = LpProblem("SupermarketAllocation", LpMaximize)
-
-# Define decision variables
-supermarkets = {
-    tract: LpVariable(f"supermarkets_{tract}", 0, MAX_SUPERMARKETS_PER_TRACT, LpInteger)
-    for tract in tracts
-}
-
-# Add binary variables to indicate if a tract has any supermarkets
-has_supermarket = {
-    tract: LpVariable(f"has_supermarket_{tract}", 0, 1, LpBinary)
-    for tract in tracts
-}
-
-# Link `supermarkets` and `has_supermarket` variables
-for tract in tracts:
-    problem += supermarkets[tract] - MAX_SUPERMARKETS_PER_TRACT * has_supermarket[tract] <= 0, f"LinkBinary_{tract}"
-
-# Normalize metrics
-max_population = max(population.values())
-max_low_income = max(low_income_households.values())
-
-# Objective function
-mean_income = np.mean(list(median_income.values()))
-problem += (
-    lpSum([
-        ALPHA * (low_income_households[tract] / max_low_income) * supermarkets[tract] +
-        BETA * (population[tract] / max_population) * supermarkets[tract]
-        for tract in tracts
-    ])
-    - lpSum([
-        has_supermarket[tract] * (median_income[tract] - mean_income) ** 2
+# Maximal covering: a tract is covered when a supermarket is within COVERAGE_RADIUS_MILES of it
+within = None
+if COVERAGE_RADIUS_MILES:
+    from coverage import cached_coverage, coverage_matrix
+    within = coverage_matrix(cached_coverage(COVERAGE_RADIUS_MILES), imperial_county_data['CensusTract'])
+
+# The same model as arrays (model_builder.py), which the heuristic solves and presolve.py reduces
+model = build_model(imperial_county_data['CensusTract'], imperial_county_data['POP2010'],
+                    imperial_county_data['TractSNAP'], imperial_county_data['MedianFamilyIncome'], edges,
+                    TOTAL_NEW_SUPERMARKETS, ADJACENCY_LIMIT, MAX_SUPERMARKETS_PER_TRACT, ALPHA, BETA, coverage=within)
+
+if SOLVER == 'heuristic':
+    # The heuristic works on the arrays, so the PuLP problem is never built
+    from heuristic import solve_heuristic
+    profiler.lap('build', model=model)
+    if DEBUG_MPS_FILE:
+        write_mps(model, DEBUG_MPS_FILE)
+
+    # Solve the problem
+    result = solve_heuristic(model)
+    assigned = dict(zip(tracts, result.values[:len(tracts)]))
+else:
+    # Presolve decides which rows the problem needs: AdjacencyLimit rows that can never bind are left out, and
+    # has_supermarket is replaced by supermarkets (or fixed to 1) when that is implied, without its LinkBinary row
+    reduced, report = presolve(model)
+    print("Presolve:", report.summary())
+
+    # Define the problem
+    problem = LpProblem("SupermarketAllocation", LpMaximize)
+
+    # Define decision variables
+    supermarkets = {
+        tract: LpVariable(f"supermarkets_{tract}", 0, MAX_SUPERMARKETS_PER_TRACT, LpInteger)
         for tract in tracts
-    ])
-), "MaximizeCombinedCoverageAndMinimizeVariance"
-
-# Total supermarkets allocation
-problem += lpSum(supermarkets.values()) == TOTAL_NEW_SUPERMARKETS, "TotalSupermarketsLimit"
-
-# Adjacency limit
-filtered_adjacency = {
-    tract: [neighbor for neighbor in neighbors if neighbor in supermarkets]
-    for tract, neighbors in adjacency.items()
-    if tract in supermarkets
-}
-
-seen = set()
-for tract, neighbors in filtered_adjacency.items():
-    for neighbor in neighbors:
-        if (tract, neighbor) not in seen and (neighbor, tract) not in seen:
-            problem += supermarkets[tract] + supermarkets[neighbor] <= ADJACENCY_LIMIT, f"AdjacencyLimit_{tract + " " + neighbor}"
-            seen.add((tract, neighbor))
-            seen.add((neighbor, tract))
-
-# Solve the problem
-solver = PULP_CBC_CMD(msg=True)
-problem.solve(solver)
+    }
+
+    if report.link_rows_removed:
+        has_supermarket = {
+            tract: supermarkets[tract] if source >= 0 else 1
+            for tract, source in zip(tracts, report.indicator_source)
+        }
+    else:
+        # Add binary variables to indicate if a tract has any supermarkets
+        has_supermarket = {
+            tract: LpVariable(f"has_supermarket_{tract}", 0, 1, LpBinary)
+            for tract in tracts
+        }
+
+        # Link `supermarkets` and `has_supermarket` variables
+        for tract in tracts:
+            problem += supermarkets[tract] - MAX_SUPERMARKETS_PER_TRACT * has_supermarket[tract] <= 0, \
+                f"LinkBinary_{tract}"
+
+    # Normalize metrics
+    max_population = max(population.values())
+    max_low_income = max(low_income_households.values())
+
+    # Maximal covering: a tract is covered when a supermarket is within COVERAGE_RADIUS_MILES of it
+    covered = supermarkets
+    if COVERAGE_RADIUS_MILES:
+        covered = {
+            tract: LpVariable(f"covered_{tract}", 0, 1, LpBinary)
+            for tract in tracts
+        }
+        for j, tract in enumerate(tracts):
+            nearby = within.indices[within.indptr[j]:within.indptr[j + 1]]
+            problem += covered[tract] - lpSum(supermarkets[tracts[i]] for i in nearby) <= 0, f"Covering_{tract}"
+
+    # Objective function
+    mean_income = np.mean(list(median_income.values()))
+    problem += (
+        lpSum([
+            ALPHA * (low_income_households[tract] / max_low_income) * covered[tract] +
+            BETA * (population[tract] / max_population) * covered[tract]
+            for tract in tracts
+        ])
+        - lpSum([
+            has_supermarket[tract] * (median_income[tract] - mean_income) ** 2
+            for tract in tracts
+        ])
+    ), "MaximizeCombinedCoverageAndMinimizeVariance"
+
+    # Total supermarkets allocation
+    problem += lpSum(supermarkets.values()) == TOTAL_NEW_SUPERMARKETS, "TotalSupermarketsLimit"
+
+    # Adjacency limit, only on the pairs of tracts where it can bind
+    for a, b in reduced.edges:
+        tract, neighbor = tracts[a], tracts[b]
+        problem += supermarkets[tract] + supermarkets[neighbor] <= ADJACENCY_LIMIT, f"AdjacencyLimit_{tract}_{neighbor}"
+
+    profiler.lap('build', model=problem)
+
+    # Solve the problem
+    solve_options = SolveOptions(threads=SOLVER_THREADS, time_limit=SOLVER_TIME_LIMIT, gap_rel=SOLVER_GAP,
+                                 warm_start=WARM_START_FILE, scratch_dir=SCRATCH_DIR, lp_file=DEBUG_LP_FILE,
+                                 mps_file=DEBUG_MPS_FILE, msg=True)
+    result = solve_problem(problem, solve_options)
+    assigned = {tract: supermarkets[tract].varValue for tract in tracts}
+profiler.lap('solve', status=result.status, nodes=result.nodes)
+
+# An infeasible or unfinished solve (or a heuristic that fell short of the budget) leaves no valid allocation
+if result.status not in FEASIBLE_STATUSES or round(sum(assigned.values())) != TOTAL_NEW_SUPERMARKETS:
+    raise SystemExit(f"Optimization Status: {result.status}; no allocation of {TOTAL_NEW_SUPERMARKETS} supermarkets "
+                     f"was found, so assigned_supermarkets.csv was not written")
 
 # Assign results
 imperial_county_data['CensusTract'] = imperial_county_data['CensusTract'].astype(str)
-imperial_county_data['Assigned_Supermarkets'] = imperial_county_data['CensusTract'].map(
-    lambda tract: supermarkets[tract].varValue
-)
+imperial_county_data['Assigned_Supermarkets'] = imperial_county_data['CensusTract'].map(assigned)
 
 # Save results
 output_file_path = 'assigned_supermarkets.csv'
-imperial_county_data.to_csv(output_file_path, index=False)
+csv_types(imperial_county_data).to_csv(output_file_path, index=False)
+profiler.lap('write')
 print(f"Supermarket allocation results saved to: {output_file_path}")
 
 # Output results
-print("Optimization Status:", problem.status)
+print("Optimization Status:", result.status)
+print(f"Objective: {result.objective}, bound: {result.bound}, gap: {result.gap}, "
+      f"wall time: {result.wall_time:.2f}s, nodes: {result.nodes}")
 for tract in tracts:
-    print(f"Census Tract {tract}: {supermarkets[tract].varValue} supermarkets")
-
-debuggingFile = 'debugLP.lp'
-problem.writeLP(debuggingFile)
-
-# visualization
-"imperial_county.xlsx"
-imperial = gpd.read_file("imperial_county_supp/imperial_county.shp")
-fig = plt.figure()
-ax = fig.add_axes([0, 0, 1, 1])
-imperial.plot(column="TractSNAP", ax=ax, edgecolor="floralwhite", vmin=0, vmax=1000, linewidth=0.5, legend=True, legend_kwds={'label': "Tract Snap", 'orientation': "vertical"})
-plt.title("Imperial County Population Receiving Snap by Tracts, 2010")
-plt.savefig('tract_snap.svg', bbox_inches='tight')
-
-fig2 = plt.figure()
-ax2 = fig2.add_axes([0, 0, 1, 1])
-imperial.plot(column="POP2010", ax=ax2, edgecolor="floralwhite", vmin=100, vmax=13000, linewidth=0.5, legend=True, legend_kwds={'label': "Population 2010", 'orientation': "vertical"})
-plt.title("Imperial County Population 2010 by Tracts")
-plt.savefig('population.svg', bbox_inches='tight')
-
-fig3 = plt.figure()
-ax3 = fig3.add_axes([0, 0, 1, 1])
-imperial.plot(column="PovertyRat", ax=ax3, edgecolor="floralwhite", vmin=0, vmax=100, linewidth=0.5, legend=True, legend_kwds={'label': "PovertyRate", 'orientation': "vertical"})
-plt.title("Imperial County Poverty Rate Tract, 2010")
-plt.savefig('povertyrate.svg', bbox_inches='tight')
-
-fig4 = plt.figure()
-ax4 = fig4.add_axes([0, 0, 1, 1])
-imperial.plot(column="GEOID10", ax=ax4, edgecolor="floralwhite", legend=True)
-plt.title("Imperial County Tract IDs")
-plt.savefig('tractmap.svg', bbox_inches='tight')
\ No newline at end of file
+    print(f"Census Tract {tract}: {assigned[tract]} supermarkets")
+
+# Maps are rendered by render.py, so a solve-only run never imports geopandas or matplotlib
+if RENDER_MAPS:
+    from render import render_maps
+    render_maps()
+    profiler.lap('render')
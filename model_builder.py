@@ -0,0 +1,268 @@
+"""
+This module builds the supermarket allocation MILP from main.py directly as arrays, so the same
+formulation can be written and solved for state or national tract counts without creating one
+PuLP expression per tract."""
+import os
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+
+# Same defaults as main.py
+TOTAL_NEW_SUPERMARKETS = 30
+ADJACENCY_LIMIT = 6
+MAX_SUPERMARKETS_PER_TRACT = 1
+ALPHA = 0.7 # weight for low-income household coverage
+BETA = 0.3  # weight for population coverage
+
+
+@dataclass
+class AllocationModel:
+    """Array form of the SupermarketAllocation problem.
+
+    Columns 0..n-1 are supermarkets_<tract> and columns n..2n-1 are has_supermarket_<tract>.
+    Rows are LinkBinary_<tract> (n), TotalSupermarketsLimit (1) and AdjacencyLimit_<a>_<b> (m),
+    in that order. With the maximal covering objective, columns 2n..3n-1 are covered_<tract> and
+    Covering_<tract> rows (n) come last. A presolved model (see presolve.py) may have no
+    has_supermarket_<tract> columns or LinkBinary_<tract> rows, and only the adjacency rows that
+    can bind. The constraint matrix is stored as COO triplets.
+    """
+    tracts: np.ndarray      # int64 CensusTract ids, one per tract
+    edges: np.ndarray       # (m, 2) tract positions of each unique adjacency pair
+    objective: np.ndarray   # maximisation coefficients, one per column
+    rows: np.ndarray
+    cols: np.ndarray
+    values: np.ndarray
+    sense: np.ndarray       # 'L' or 'E' per row
+    rhs: np.ndarray
+    upper: np.ndarray       # upper bound per column, lower bounds are all zero
+    integer: np.ndarray     # integrality flag per column
+    covering: bool = False  # whether the covered_<tract> columns and Covering_<tract> rows exist
+    indicators: bool = True # whether the has_supermarket_<tract> columns and LinkBinary_<tract> rows exist
+
+    @property
+    def num_tracts(self):
+        return len(self.tracts)
+
+    @property
+    def total_row(self):
+        return self.num_tracts if self.indicators else 0
+
+    @property
+    def adjacency_rows(self):
+        return slice(self.total_row + 1, self.total_row + 1 + len(self.edges))
+
+    def column_names(self):
+        tracts = self.tracts.astype(str)
+        names = [np.char.add('supermarkets_', tracts)]
+        if self.indicators:
+            names.append(np.char.add('has_supermarket_', tracts))
+        if self.covering:
+            names.append(np.char.add('covered_', tracts))
+        return np.concatenate(names)
+
+    def row_names(self):
+        tracts = self.tracts.astype(str)
+        a = tracts[self.edges[:, 0]]
+        b = tracts[self.edges[:, 1]]
+        adjacency = np.char.add(np.char.add(np.char.add('AdjacencyLimit_', a), '_'), b)
+        names = [np.char.add('LinkBinary_', tracts)] if self.indicators else []
+        names += [['TotalSupermarketsLimit'], adjacency]
+        if self.covering:
+            names.append(np.char.add('Covering_', tracts))
+        return np.concatenate(names)
+
+
+def unique_edges(edges):
+    """Return each undirected edge once as (low, high), dropping self loops."""
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    edges = np.sort(edges, axis=1)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    return np.unique(edges, axis=0)
+
+
+def objective_terms(population, snap, income):
+    """Per-tract normalised SNAP and population coverage, and the income variance penalty."""
+    max_population = population.max() if len(population) and population.max() > 0 else 1.0
+    max_low_income = snap.max() if len(snap) and snap.max() > 0 else 1.0
+    mean_income = income.mean() if len(income) else 0.0
+    return snap / max_low_income, population / max_population, (income - mean_income) ** 2
+
+
+def objective_vector(terms, alpha, beta):
+    """Objective coefficients: weighted coverage on supermarkets, income penalty on has_supermarket."""
+    low_income, population, penalty = terms
+    return np.concatenate([alpha * low_income + beta * population, -penalty])
+
+
+def build_model(tracts, population, snap, income, edges,
+                total_supermarkets=TOTAL_NEW_SUPERMARKETS, adjacency_limit=ADJACENCY_LIMIT,
+                max_per_tract=MAX_SUPERMARKETS_PER_TRACT, alpha=ALPHA, beta=BETA, coverage=None):
+    """Build the allocation model from per-tract arrays and an (m, 2) array of tract positions.
+
+    `coverage` is an optional sparse (tracts x tracts) matrix from coverage.coverage_matrix. When given,
+    the coverage score of a tract is earned by covered_<tract>, which can only be 1 when a supermarket
+    is within the radius (the maximal covering objective), instead of by supermarkets_<tract>.
+    """
+    tracts = np.asarray(tracts, dtype=np.int64)
+    population = np.asarray(population, dtype=np.float64)
+    snap = np.asarray(snap, dtype=np.float64)
+    income = np.asarray(income, dtype=np.float64)
+    edges = unique_edges(edges)
+    n = len(tracts)
+    m = len(edges)
+    index = np.arange(n)
+
+    objective = objective_vector(objective_terms(population, snap, income), alpha, beta)
+
+    # LinkBinary: supermarkets - MAX * has_supermarket <= 0
+    link_rows = np.concatenate([index, index])
+    link_cols = np.concatenate([index, index + n])
+    link_values = np.concatenate([np.ones(n), np.full(n, -float(max_per_tract))])
+
+    # TotalSupermarketsLimit: sum(supermarkets) == TOTAL
+    total_rows = np.full(n, n)
+    total_cols = index
+    total_values = np.ones(n)
+
+    # AdjacencyLimit: supermarkets_a + supermarkets_b <= LIMIT
+    adjacency_rows = np.repeat(np.arange(n + 1, n + 1 + m), 2)
+    adjacency_cols = edges.reshape(-1)
+    adjacency_values = np.ones(2 * m)
+
+    sense = np.array(['L'] * n + ['E'] + ['L'] * m)
+    rhs = np.concatenate([np.zeros(n), [float(total_supermarkets)], np.full(m, float(adjacency_limit))])
+    rows = [link_rows, total_rows, adjacency_rows]
+    cols = [link_cols, total_cols, adjacency_cols]
+    values = [link_values, total_values, adjacency_values]
+    upper = [np.full(n, float(max_per_tract)), np.ones(n)]
+
+    if coverage is not None:
+        # Covering: covered_j - sum of supermarkets_i within the radius of j <= 0
+        within = coverage.tocoo()
+        first_row = n + 1 + m
+        rows += [first_row + index, first_row + within.row]
+        cols += [2 * n + index, within.col]
+        values += [np.ones(n), -np.ones(within.nnz)]
+        sense = np.concatenate([sense, ['L'] * n])
+        rhs = np.concatenate([rhs, np.zeros(n)])
+        upper.append(np.ones(n))
+        objective = np.concatenate([np.zeros(n), objective[n:], objective[:n]])
+
+    return AllocationModel(
+        tracts=tracts,
+        edges=edges,
+        objective=objective,
+        rows=np.concatenate(rows),
+        cols=np.concatenate(cols),
+        values=np.concatenate(values),
+        sense=sense,
+        rhs=rhs,
+        upper=np.concatenate(upper),
+        integer=np.ones(len(upper) * n, dtype=bool),
+        covering=coverage is not None,
+    )
+
+
+def _lines(*parts):
+    """Join string arrays and scalars element-wise into one list of lines."""
+    columns = [np.asarray(part).astype(str).tolist() if np.ndim(part) else None for part in parts]
+    length = max(len(column) for column in columns if column is not None)
+    columns = [column if column is not None else [str(part)] * length for part, column in zip(parts, columns)]
+    return list(map(''.join, zip(*columns)))
+
+
+def write_mps(model, path, relax=False):
+    """Write the model as a minimisation MPS file (objective negated) in bulk.
+
+    With `relax` the integrality markers are left out, giving the LP relaxation.
+    """
+    col_names = model.column_names()
+    row_names = model.row_names()
+
+    # Objective entries and matrix entries, grouped by column
+    objective_cols = np.flatnonzero(model.objective)
+    cols = np.concatenate([objective_cols, model.cols])
+    entry_rows = np.concatenate([np.full(len(objective_cols), 'OBJ'), row_names[model.rows]])
+    values = np.concatenate([-model.objective[objective_cols], model.values])
+    order = np.argsort(cols, kind='stable')
+    cols = cols[order]
+    column_lines = _lines('    ', col_names[cols], '  ', entry_rows[order], '  ', values[order])
+
+    if not relax:
+        # Wrap each run of integer columns in MARKER lines
+        integer = model.integer[cols]
+        change = np.flatnonzero(np.diff(integer.astype(np.int8))) + 1
+        starts = np.concatenate([[0], change]).tolist()
+        stops = change.tolist() + [len(cols)]
+        pieces = []
+        for marker, (start, stop) in enumerate(zip(starts, stops)):
+            if integer[start]:
+                pieces.append(f"    MARKER{2 * marker}  'MARKER'  'INTORG'")
+                pieces.extend(column_lines[start:stop])
+                pieces.append(f"    MARKER{2 * marker + 1}  'MARKER'  'INTEND'")
+            else:
+                pieces.extend(column_lines[start:stop])
+        column_lines = pieces
+
+    rhs_index = np.flatnonzero(model.rhs)
+    bounded = np.flatnonzero(np.isfinite(model.upper))
+    with open(path, 'w') as f:
+        f.write("NAME          SupermarketAllocation\nROWS\n N  OBJ\n")
+        f.write('\n'.join(_lines(' ', model.sense, '  ', row_names)) + '\n')
+        f.write('COLUMNS\n')
+        f.write('\n'.join(column_lines) + '\n')
+        f.write('RHS\n')
+        if len(rhs_index):
+            f.write('\n'.join(_lines('    RHS  ', row_names[rhs_index], '  ', model.rhs[rhs_index])) + '\n')
+        f.write('BOUNDS\n')
+        if len(bounded):
+            f.write('\n'.join(_lines(' UP BND  ', col_names[bounded], '  ', model.upper[bounded])) + '\n')
+        f.write('ENDATA\n')
+
+
+def write_mip_start(model, values, path):
+    """Write column values as a CBC solution file that can be read back as a MIP start."""
+    names = model.column_names()
+    lines = _lines('      ', np.arange(len(names)), ' ', names, '  ', np.asarray(values, dtype=np.float64), '  0')
+    with open(path, 'w') as f:
+        f.write("Stopped on iterations - objective value 0\n")
+        f.write('\n'.join(lines) + '\n')
+
+
+def solve_model(model, options=None, relax=False, warm_start=None):
+    """Solve the model with CBC and return a solver.SolveResult holding every column value.
+
+    `options` is a solver.SolveOptions and `warm_start` an optional array of column values passed to
+    CBC as a MIP start.
+    """
+    from solver import SolveOptions, solve_mps
+
+    options = options or SolveOptions()
+    with tempfile.TemporaryDirectory(dir=options.scratch_dir) as tmp_dir:
+        mps_path = os.path.join(tmp_dir, 'model.mps')
+        write_mps(model, mps_path, relax=relax)
+        start_path = None
+        if warm_start is not None and not relax:
+            start_path = os.path.join(tmp_dir, 'start.sol')
+            write_mip_start(model, warm_start, start_path)
+        return solve_mps(mps_path, len(model.objective), options, mip_start=start_path)
+
+
+def assigned_supermarkets(model, result):
+    """Rounded supermarkets_<tract> values of a solve result."""
+    return np.round(result.values[:model.num_tracts])
+
+
+if __name__ == '__main__':
+    from adjacency import load_adjacency, edges_for_tracts
+    from data_loader import load_county
+
+    county = load_county('California', 'Imperial')
+    tracts = county['CensusTract'].to_numpy()
+    edges = edges_for_tracts(load_adjacency(), tracts)
+    model = build_model(tracts, county['POP2010'], county['TractSNAP'], county['MedianFamilyIncome'], edges)
+    result = solve_model(model)
+    print("Optimization Status:", result.status)
+    print("Objective:", result.objective)
+    print("Supermarkets assigned:", int(assigned_supermarkets(model, result).sum()))
@@ -0,0 +1,168 @@
+"""
+This module shrinks an allocation model from model_builder.py before it is handed to CBC, and maps the
+reduced solution back to the original columns. It removes
+
+- AdjacencyLimit rows that can never bind, because the two tracts' upper bounds (or the whole budget) already
+  fit under the limit, e.g. every row when MAX_SUPERMARKETS_PER_TRACT = 1 and ADJACENCY_LIMIT = 6;
+- the has_supermarket binaries and LinkBinary rows when they are implied: with at most one supermarket per
+  tract has_supermarket equals supermarkets at the optimum, so its income-variance penalty is folded into the
+  supermarkets coefficient, and a non-negative has_supermarket coefficient just fixes it to 1."""
+import argparse
+import dataclasses
+import os
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+
+from model_builder import write_mps
+
+
+@dataclass
+class PresolveReport:
+    rows_before: int
+    rows_after: int
+    columns_before: int
+    columns_after: int
+    nonzeros_before: int
+    nonzeros_after: int
+    adjacency_rows_removed: int
+    link_rows_removed: int
+    indicators_substituted: int  # has_supermarket replaced by supermarkets
+    indicators_fixed: int        # has_supermarket fixed to 1
+    objective_offset: float      # constant dropped from the objective by fixing columns
+    kept_columns: np.ndarray     # original column of every reduced column
+    indicator_source: np.ndarray # per tract: -1 fixed to 1, otherwise the reduced column it equals
+
+    def summary(self):
+        return (f"rows {self.rows_before} -> {self.rows_after}, columns {self.columns_before} -> "
+                f"{self.columns_after}, nonzeros {self.nonzeros_before} -> {self.nonzeros_after} "
+                f"({self.adjacency_rows_removed} AdjacencyLimit and {self.link_rows_removed} LinkBinary rows removed, "
+                f"{self.indicators_substituted} has_supermarket substituted, {self.indicators_fixed} fixed)")
+
+
+def presolve(model):
+    """Return the reduced model and a PresolveReport for mapping its solution back."""
+    n = model.num_tracts
+    num_rows = len(model.rhs)
+    num_columns = len(model.objective)
+    supermarkets_upper = model.upper[:n]
+    budget = model.rhs[model.total_row] if model.sense[model.total_row] == 'E' else np.inf
+
+    # AdjacencyLimit rows are redundant when both tracts at their upper bounds, or the whole budget, fit
+    adjacency_rows = np.arange(num_rows)[model.adjacency_rows]
+    limits = model.rhs[adjacency_rows]
+    pair_upper = supermarkets_upper[model.edges[:, 0]] + supermarkets_upper[model.edges[:, 1]]
+    redundant_edges = (pair_upper <= limits) | (budget <= limits)
+
+    keep_rows = np.ones(num_rows, dtype=bool)
+    keep_rows[adjacency_rows[redundant_edges]] = False
+    keep_columns = np.ones(num_columns, dtype=bool)
+    objective = model.objective.copy()
+    offset = 0.0
+    indicator_source = np.arange(n)
+    substitute = fix = np.zeros(n, dtype=bool)
+    drop_indicators = False
+
+    if model.indicators:
+        penalty = model.objective[n:2 * n]
+        substitute = (supermarkets_upper == 1) & model.integer[:n] & (penalty <= 0)
+        fix = ~substitute & (penalty >= 0)
+        # The indicator block only goes if every tract's indicator is implied, keeping the model layout intact
+        drop_indicators = bool((substitute | fix).all())
+        if drop_indicators:
+            objective[:n] += np.where(substitute, penalty, 0.0)
+            offset = penalty[fix].sum()
+            indicator_source = np.where(substitute, np.arange(n), -1)
+            keep_rows[:n] = False
+            keep_columns[n:2 * n] = False
+        else:
+            substitute = fix = np.zeros(n, dtype=bool)
+
+    # Drop the matrix entries of removed rows and columns, then renumber the rest
+    entries = keep_rows[model.rows] & keep_columns[model.cols]
+    row_index = np.cumsum(keep_rows) - 1
+    column_index = np.cumsum(keep_columns) - 1
+    reduced = dataclasses.replace(
+        model,
+        edges=model.edges[~redundant_edges],
+        objective=objective[keep_columns],
+        rows=row_index[model.rows[entries]],
+        cols=column_index[model.cols[entries]],
+        values=model.values[entries],
+        sense=model.sense[keep_rows],
+        rhs=model.rhs[keep_rows],
+        upper=model.upper[keep_columns],
+        integer=model.integer[keep_columns],
+        indicators=model.indicators and not drop_indicators,
+    )
+    report = PresolveReport(
+        rows_before=num_rows,
+        rows_after=int(keep_rows.sum()),
+        columns_before=num_columns,
+        columns_after=int(keep_columns.sum()),
+        nonzeros_before=len(model.values),
+        nonzeros_after=int(entries.sum()),
+        adjacency_rows_removed=int(redundant_edges.sum()),
+        link_rows_removed=n if drop_indicators else 0,
+        indicators_substituted=int(substitute.sum()),
+        indicators_fixed=int(fix.sum()),
+        objective_offset=float(offset),
+        kept_columns=np.flatnonzero(keep_columns),
+        indicator_source=indicator_source,
+    )
+    return reduced, report
+
+
+def postsolve(model, report, reduced_values):
+    """Column values of the original model from the values of the reduced model."""
+    n = model.num_tracts
+    values = np.zeros(len(model.objective))
+    values[report.kept_columns] = reduced_values
+    if model.indicators and report.link_rows_removed:
+        values[n:2 * n] = np.where(report.indicator_source >= 0,
+                                   reduced_values[np.maximum(report.indicator_source, 0)], 1.0)
+    return values
+
+
+def solve_presolved(model, options=None, warm_start=None):
+    """Presolve, solve with CBC and map the result back, returning (SolveResult, PresolveReport)."""
+    from model_builder import solve_model
+
+    reduced, report = presolve(model)
+    start = None if warm_start is None else np.asarray(warm_start)[report.kept_columns]
+    result = solve_model(reduced, options, warm_start=start)
+    result.values = postsolve(model, report, result.values)
+    result.objective += report.objective_offset
+    result.bound += report.objective_offset
+    return result, report
+
+
+if __name__ == '__main__':
+    from adjacency import load_adjacency, edges_for_tracts
+    from data_loader import load_county
+    from model_builder import build_model, solve_model
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--state', default='California')
+    parser.add_argument('--county', default='Imperial')
+    args = parser.parse_args()
+
+    county = load_county(args.state, args.county)
+    edges = edges_for_tracts(load_adjacency(), county['CensusTract'])
+    model = build_model(county['CensusTract'], county['POP2010'], county['TractSNAP'], county['MedianFamilyIncome'],
+                        edges)
+    reduced, report = presolve(model)
+    print("Presolve:", report.summary())
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, candidate in [('original', model), ('presolved', reduced)]:
+            path = os.path.join(tmp_dir, f"{name}.mps")
+            write_mps(candidate, path)
+            print(f"{name} MPS file: {os.path.getsize(path)} bytes")
+
+    original = solve_model(model)
+    presolved, _ = solve_presolved(model)
+    print(f"Objective: original {original.objective} ({original.wall_time:.3f}s), "
+          f"presolved {presolved.objective} ({presolved.wall_time:.3f}s)")
+    print("Same allocation:", np.array_equal(np.round(original.values), np.round(presolved.values)))
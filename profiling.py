@@ -0,0 +1,79 @@
+"""
+This module records where a run spends its time. Each stage (load, build, solve, write, ...) becomes one JSON
+line with its wall time, the process's peak resident memory so far and, for model stages, the model size
+(variables, rows and nonzeros). Profiling is off unless a file is given, either to Profiler directly or
+through the PROFILE_FILE environment variable, so unprofiled runs only pay for a few perf_counter calls."""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (NaN where it cannot be measured)."""
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def model_size(model):
+    """Variables, rows and nonzeros of a model_builder AllocationModel or a PuLP problem."""
+    if hasattr(model, 'values') and hasattr(model, 'rhs'):
+        return {'variables': len(model.objective), 'rows': len(model.rhs), 'nonzeros': len(model.values)}
+    constraints = model.constraints.values()
+    return {'variables': len(model.variables()), 'rows': len(constraints),
+            'nonzeros': sum(len(constraint) for constraint in constraints)}
+
+
+class Profiler:
+    """Writes one JSON line per stage to `path`, tagged with `fields` (e.g. the script name)."""
+
+    def __init__(self, path=None, **fields):
+        self.path = path or os.environ.get('PROFILE_FILE')
+        self.fields = fields
+        self.records = []
+        self.last = time.perf_counter()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def record(self, stage, seconds, **fields):
+        if not self.enabled:
+            return None
+        record = {**self.fields, 'stage': stage, 'seconds': round(seconds, 6), 'peak_rss_mb': round(peak_rss_mb(), 2),
+                  **fields}
+        self.records.append(record)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        return record
+
+    def lap(self, stage, model=None, **fields):
+        """Record the time since the previous lap (or since the profiler was created) as `stage`."""
+        now = time.perf_counter()
+        seconds, self.last = now - self.last, now
+        if model is not None and self.enabled:
+            fields.update(model_size(model))
+        return self.record(stage, seconds, **fields)
+
+    @contextmanager
+    def stage(self, stage, **fields):
+        """Record the time spent in the with block as `stage`; yields a dict for fields known only at the end."""
+        extra = {}
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.last = time.perf_counter()
+            model = extra.pop('model', None)
+            if model is not None and self.enabled:
+                extra.update(model_size(model))
+            self.record(stage, self.last - start, **fields, **extra)
@@ -0,0 +1,268 @@
+"""
+This script renders the county maps (tract_snap.svg, population.svg, povertyrate.svg, tractmap.svg and
+supermarkets.svg for the allocation in assigned_supermarkets.csv) as a stage of its own, outside main.py.
+
+The shapefile is read and simplified once into data/render_cache (WKB geometries plus the tract GEOIDs), so
+later runs need neither geopandas' file reader nor the full-detail polygons. The plotted values are joined
+from the atlas by GEOID (see data_loader.py), so any tract shapefile with a GEOID or GEOID10 field works,
+e.g. the statewide data/tl_rd22_06_tract, and map titles name the county or state the tracts cover. A map is only
+re-rendered when the hash of its inputs (geometry, plotted column, map settings and output mode) changes, and
+the maps that did change are rendered in a pool of worker processes. Besides SVG, maps can be written as PNG
+or as a grid of PNG tiles, which stays small for state-scale maps with thousands of tract polygons."""
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_loader import open_columns, ATLAS_PATH, CACHE_DIR
+
+SHAPEFILE = 'imperial_county_supp/imperial_county.shp'
+RENDER_CACHE_DIR = 'data/render_cache'
+ALLOCATION_FILE = 'assigned_supermarkets.csv'
+SIMPLIFY_TOLERANCE = 50.0 # meters, converted to the shapefile's CRS units; 0 keeps full detail
+METERS_PER_DEGREE = 111320.0 # along a meridian; east-west a degree is shorter, so simplification stays conservative
+TRACT_COLUMNS = ['GEOID', 'GEOID10'] # tract id field of TIGER/Line tract shapefiles, 2020 and 2010
+TILES = 4                 # tiles per side in tiles mode
+DPI = 200
+
+# Columns are atlas columns, except GEOID (the shapefile's tract ids) and Assigned_Supermarkets (the allocation)
+MAPS = [
+    {'name': 'tract_snap', 'column': 'TractSNAP', 'title': "{place} Population Receiving Snap by Tracts, 2010",
+     'label': "Tract Snap", 'vmin': 0, 'vmax': 1000},
+    {'name': 'population', 'column': 'POP2010', 'title': "{place} Population 2010 by Tracts",
+     'label': "Population 2010", 'vmin': 100, 'vmax': 13000},
+    {'name': 'povertyrate', 'column': 'PovertyRate', 'title': "{place} Poverty Rate Tract, 2010",
+     'label': "PovertyRate", 'vmin': 0, 'vmax': 100},
+    {'name': 'tractmap', 'column': 'GEOID', 'title': "{place} Tract IDs", 'categorical': True},
+    {'name': 'supermarkets', 'column': 'Assigned_Supermarkets', 'title': "{place} Assigned Supermarkets",
+     'label': "Assigned Supermarkets", 'vmin': 0, 'vmax': 1},
+]
+
+
+def _source_stamp(path):
+    stamps = {}
+    for extension in ['.shp', '.shx', '.dbf']:
+        part = os.path.splitext(path)[0] + extension
+        if os.path.exists(part):
+            stat = os.stat(part)
+            stamps[extension] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    return {'path': os.path.abspath(path), 'files': stamps}
+
+
+def crs_tolerance(crs, meters):
+    """A distance in meters in the units of `crs` (degrees for geographic CRSs such as NAD83)."""
+    if crs is None or not meters:
+        return meters
+    if crs.is_geographic:
+        return meters / METERS_PER_DEGREE
+    return meters / crs.axis_info[0].unit_conversion_factor
+
+
+def build_geometry_cache(shapefile=SHAPEFILE, cache_dir=RENDER_CACHE_DIR, tolerance=SIMPLIFY_TOLERANCE):
+    """Read and simplify the shapefile once, unless the cache already holds it at this tolerance (in meters).
+
+    Returns the cache's source.json contents.
+    """
+    source_path = os.path.join(cache_dir, 'source.json')
+    source = {'source': _source_stamp(shapefile), 'tolerance': tolerance}
+    if os.path.exists(source_path):
+        with open(source_path, 'r') as f:
+            cached = json.load(f)
+        if {key: cached.get(key) for key in source} == source and 'tract_column' in cached:
+            return cached
+
+    import geopandas as gpd
+    import shapely
+
+    frame = gpd.read_file(shapefile)
+    tract_column = next((column for column in TRACT_COLUMNS if column in frame.columns), None)
+    if tract_column is None:
+        raise ValueError(f"{shapefile} has none of the tract id fields {TRACT_COLUMNS}")
+    geometry = frame.geometry.values
+    if tolerance:
+        geometry = shapely.simplify(geometry, crs_tolerance(frame.crs, tolerance), preserve_topology=True)
+    wkb = shapely.to_wkb(geometry)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, 'geometry.npy'), np.frombuffer(b''.join(wkb), dtype=np.uint8))
+    np.save(os.path.join(cache_dir, 'offsets.npy'), np.concatenate([[0], np.cumsum([len(item) for item in wkb])]))
+    np.save(os.path.join(cache_dir, 'GEOID.npy'), frame[tract_column].to_numpy().astype(str))
+
+    source.update({'crs': frame.crs.to_string() if frame.crs else None, 'tract_column': tract_column,
+                   'bounds': frame.total_bounds.tolist()})
+    with open(source_path, 'w') as f:
+        json.dump(source, f)
+    return source
+
+
+def load_column(cache_dir, column):
+    return np.load(os.path.join(cache_dir, f"{column}.npy"), mmap_mode='r')
+
+
+def load_geometry(cache_dir=RENDER_CACHE_DIR):
+    """The cached, simplified tract polygons as a shapely array."""
+    import shapely
+
+    data = np.load(os.path.join(cache_dir, 'geometry.npy'))
+    offsets = np.load(os.path.join(cache_dir, 'offsets.npy'))
+    return shapely.from_wkb([data[start:stop].tobytes() for start, stop in zip(offsets[:-1], offsets[1:])])
+
+
+def atlas_rows(cache_dir=RENDER_CACHE_DIR, atlas_path=ATLAS_PATH, atlas_cache_dir=CACHE_DIR):
+    """Atlas row of every cached tract, -1 for tracts the atlas does not have."""
+    geoids = np.asarray(load_column(cache_dir, 'GEOID')).astype(np.int64)
+    _, arrays = open_columns(['CensusTract'], atlas_path, atlas_cache_dir)
+    atlas_tracts = np.asarray(arrays['CensusTract'])
+    if not len(atlas_tracts):
+        return np.full(len(geoids), -1)
+    order = np.argsort(atlas_tracts, kind='stable')
+    positions = np.minimum(np.searchsorted(atlas_tracts[order], geoids), len(order) - 1)
+    return np.where(atlas_tracts[order][positions] == geoids, order[positions], -1)
+
+
+def place_name(rows, atlas_path=ATLAS_PATH, atlas_cache_dir=CACHE_DIR):
+    """'<County> County' when the tracts are all in one county, else the state name (or states)."""
+    index, _ = open_columns([], atlas_path, atlas_cache_dir)
+    places = {(state, county) for state, counties in index['counties'].items()
+              for county, (start, stop) in counties.items() if ((rows >= start) & (rows < stop)).any()}
+    if len(places) == 1:
+        return f"{next(iter(places))[1]} County"
+    return ", ".join(sorted({state for state, _ in places}))
+
+
+def map_values(spec, rows, cache_dir=RENDER_CACHE_DIR, allocation_file=ALLOCATION_FILE, atlas_path=ATLAS_PATH,
+               atlas_cache_dir=CACHE_DIR):
+    """Values of the map's column per cached tract, joined by GEOID; NaN for tracts missing from the atlas."""
+    geoids = np.asarray(load_column(cache_dir, 'GEOID'))
+    if spec['column'] == 'GEOID':
+        return geoids
+    if spec['column'] == 'Assigned_Supermarkets':
+        import pandas as pd
+
+        allocation = pd.read_csv(allocation_file, usecols=['CensusTract', 'Assigned_Supermarkets'])
+        assigned = dict(zip(allocation['CensusTract'], allocation['Assigned_Supermarkets']))
+        return np.array([assigned.get(tract, 0.0) for tract in geoids.astype(np.int64)])
+    _, arrays = open_columns([spec['column']], atlas_path, atlas_cache_dir)
+    values = np.asarray(arrays[spec['column']], dtype=np.float64)
+    return np.where(rows >= 0, values[np.maximum(rows, 0)], np.nan) if len(values) else np.full(len(rows), np.nan)
+
+
+def map_hash(spec, values, source, mode, tiles, dpi):
+    """Hash of everything a rendered map depends on."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([spec, source, mode, tiles, dpi], sort_keys=True).encode())
+    digest.update(np.ascontiguousarray(values).astype(str).tobytes() if values.dtype.kind in 'OU'
+                  else np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def output_path(spec, output_dir, mode):
+    if mode == 'tiles':
+        return os.path.join(output_dir, f"{spec['name']}_tiles")
+    return os.path.join(output_dir, f"{spec['name']}.{mode}")
+
+
+def render_map(spec, values, path, mode, cache_dir=RENDER_CACHE_DIR, tiles=TILES, dpi=DPI):
+    """Render one map in the current process; geopandas and matplotlib are only imported here."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import geopandas as gpd
+
+    with open(os.path.join(cache_dir, 'source.json'), 'r') as f:
+        source = json.load(f)
+    frame = gpd.GeoDataFrame({spec['column']: values}, geometry=load_geometry(cache_dir), crs=source['crs'])
+
+    fig = plt.figure()
+    ax = fig.add_axes([0, 0, 1, 1])
+    if spec.get('categorical'):
+        frame.plot(column=spec['column'], ax=ax, edgecolor="floralwhite", linewidth=0.5, legend=mode != 'tiles')
+    else:
+        frame.plot(column=spec['column'], ax=ax, edgecolor="floralwhite", vmin=spec['vmin'], vmax=spec['vmax'],
+                   linewidth=0.5, legend=mode != 'tiles',
+                   legend_kwds={'label': spec['label'], 'orientation': "vertical"})
+
+    if mode != 'tiles':
+        plt.title(spec['title'])
+        plt.savefig(path, bbox_inches='tight', dpi=dpi if mode == 'png' else None)
+    else:
+        # One small PNG per cell of a tiles x tiles grid over the map's extent, named <row>_<column>.png
+        os.makedirs(path, exist_ok=True)
+        ax.set_axis_off()
+        min_x, min_y, max_x, max_y = source['bounds']
+        xs = np.linspace(min_x, max_x, tiles + 1)
+        ys = np.linspace(max_y, min_y, tiles + 1)
+        for row in range(tiles):
+            for column in range(tiles):
+                ax.set_xlim(xs[column], xs[column + 1])
+                ax.set_ylim(ys[row + 1], ys[row])
+                fig.savefig(os.path.join(path, f"{row}_{column}.png"), dpi=dpi)
+    plt.close(fig)
+    return path
+
+
+def render_maps(names=None, output_dir='.', mode='svg', workers=None, force=False, shapefile=SHAPEFILE,
+                cache_dir=RENDER_CACHE_DIR, allocation_file=ALLOCATION_FILE, tiles=TILES, dpi=DPI, place=None,
+                atlas_path=ATLAS_PATH, atlas_cache_dir=CACHE_DIR):
+    """Render the maps whose inputs changed since their last render, in parallel. Returns the rendered paths.
+
+    `place` names the area in the map titles; by default the county or state the shapefile's tracts are in.
+    """
+    source = build_geometry_cache(shapefile, cache_dir)
+    rows = atlas_rows(cache_dir, atlas_path, atlas_cache_dir)
+    place = place or place_name(rows, atlas_path, atlas_cache_dir)
+    hashes_path = os.path.join(cache_dir, 'rendered.json')
+    rendered = {}
+    if os.path.exists(hashes_path):
+        with open(hashes_path, 'r') as f:
+            rendered = json.load(f)
+
+    jobs = []
+    for spec in MAPS:
+        if names and spec['name'] not in names:
+            continue
+        if spec['column'] == 'Assigned_Supermarkets' and not os.path.exists(allocation_file):
+            continue
+        spec = dict(spec, title=spec['title'].format(place=place))
+        values = map_values(spec, rows, cache_dir, allocation_file, atlas_path, atlas_cache_dir)
+        path = output_path(spec, output_dir, mode)
+        digest = map_hash(spec, values, source, mode, tiles, dpi)
+        if force or rendered.get(os.path.abspath(path)) != digest or not os.path.exists(path):
+            jobs.append((spec, values, path, digest))
+    if not jobs:
+        return []
+
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(jobs))) as pool:
+        futures = [pool.submit(render_map, spec, values, path, mode, cache_dir, tiles, dpi)
+                   for spec, values, path, _ in jobs]
+        paths = [future.result() for future in futures]
+
+    # Only record maps that rendered, so a failed map is retried next time
+    rendered.update({os.path.abspath(path): digest for _, _, path, digest in jobs})
+    with open(hashes_path, 'w') as f:
+        json.dump(rendered, f, indent=1)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('maps', nargs='*', help=f"maps to render, out of {[spec['name'] for spec in MAPS]}; all by default")
+    parser.add_argument('--mode', choices=['svg', 'png', 'tiles'], default='svg')
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--force', action='store_true', help="render even if the inputs did not change")
+    parser.add_argument('--shapefile', default=SHAPEFILE)
+    parser.add_argument('--allocation', default=ALLOCATION_FILE)
+    parser.add_argument('--atlas', default=ATLAS_PATH)
+    parser.add_argument('--place', help="area named in the map titles, e.g. California; by default the county or state")
+    parser.add_argument('--tiles', type=int, default=TILES, help="tiles per side in tiles mode")
+    parser.add_argument('--dpi', type=int, default=DPI, help="resolution of png and tiles output")
+    args = parser.parse_args()
+
+    paths = render_maps(args.maps, args.output_dir, args.mode, args.workers, args.force, args.shapefile,
+                        allocation_file=args.allocation, tiles=args.tiles, dpi=args.dpi, place=args.place,
+                        atlas_path=args.atlas)
+    print(f"Rendered {len(paths)} maps: {', '.join(paths)}" if paths else "All maps are up to date")
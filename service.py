@@ -0,0 +1,330 @@
+"""
+This script runs a long-lived local service that answers "what if" allocation and evaluation queries without
+paying the cost of a cold `python main.py` each time. Tract data and adjacency are loaded once per county and
+the county's model is built once (per tract cap) and kept warm; a query only changes the objective and
+right-hand sides (as in sweep.py) before CBC runs in a bounded pool of worker processes, so concurrent queries
+queue instead of oversubscribing the cores. Answers are kept in an LRU cache keyed by a hash of the query.
+
+The protocol is JSON lines over TCP: one request object per line, one response per line, for example
+    {"id": 1, "op": "allocate", "county": "Imperial", "budget": 25, "alpha": 0.6, "beta": 0.4}
+    {"id": 2, "op": "evaluate", "county": "Imperial", "budget": 25}
+    {"id": 3, "op": "evaluate", "county": "Imperial", "allocation": {"6025010101": 1, "6025010200": 1}}
+    {"id": 4, "op": "stats"}
+Start it with `python service.py serve` and query it with `python service.py query '<request>' ...`; add
+--offline to answer the queries in-process without a server."""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_loader import load_county, ATLAS_PATH, CACHE_DIR
+from evaluator import tract_attributes, evaluate
+from model_builder import build_model, objective_terms, TOTAL_NEW_SUPERMARKETS, ADJACENCY_LIMIT, \
+    MAX_SUPERMARKETS_PER_TRACT, ALPHA, BETA
+from solver import SolveOptions, FEASIBLE_STATUSES
+from sweep import set_parameters
+
+HOST = '127.0.0.1'
+PORT = 8765
+CACHE_SIZE = 1024
+SELECTED_COLUMNS = ['CensusTract', 'POP2010', 'TractSNAP', 'MedianFamilyIncome']
+DEFAULTS = {
+    'state': 'California',
+    'county': 'Imperial',
+    'budget': TOTAL_NEW_SUPERMARKETS,
+    'alpha': ALPHA,
+    'beta': BETA,
+    'adjacency_limit': ADJACENCY_LIMIT,
+    'max_per_tract': MAX_SUPERMARKETS_PER_TRACT,
+}
+# Weights of the combined coverage metric, as in evaluation_main.py
+EVALUATION_WEIGHTS = {'eval_alpha': 0.4, 'eval_beta': 0.4, 'eval_gamma': 0.2}
+
+
+def query_key(op, params):
+    """Hash of a query's operation and its full parameter set."""
+    return hashlib.sha256(json.dumps([op, params], sort_keys=True).encode()).hexdigest()
+
+
+def _plain(value):
+    """JSON-safe copy of a result: numpy scalars to Python numbers, NaN to null."""
+    if isinstance(value, dict):
+        return {str(key): _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_plain(item) for item in value]
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    return value
+
+
+def solve_allocation(model, options):
+    """Worker process: solve one parameterised model and return its status and supermarkets per tract."""
+    from presolve import solve_presolved
+
+    result, _ = solve_presolved(model, options)
+    return {
+        'status': result.status,
+        'objective': result.objective,
+        'bound': result.bound,
+        'gap': result.gap,
+        'solve_seconds': result.wall_time,
+        'assigned': np.round(result.values[:model.num_tracts]).astype(np.int64),
+    }
+
+
+class County:
+    """One county's tract data, evaluation attributes and warm models, loaded once."""
+
+    def __init__(self, state, county, atlas_path, cache_dir, adjacency):
+        from adjacency import edges_for_tracts
+
+        data = load_county(state, county, SELECTED_COLUMNS, atlas_path, cache_dir)
+        if data.empty:
+            raise ValueError(f"unknown county {county!r} in {state!r}")
+        self.data = data.dropna(subset=SELECTED_COLUMNS).reset_index(drop=True)
+        self.tracts = self.data['CensusTract'].to_numpy()
+        self.position = {int(tract): i for i, tract in enumerate(self.tracts)}
+        self.population = self.data['POP2010'].to_numpy(dtype=np.float64)
+        self.snap = self.data['TractSNAP'].to_numpy(dtype=np.float64)
+        self.income = self.data['MedianFamilyIncome'].to_numpy(dtype=np.float64)
+        self.edges = edges_for_tracts(adjacency, self.tracts) if adjacency is not None else np.empty((0, 2), np.int64)
+        self.terms = objective_terms(self.population, self.snap, self.income)
+        self.attributes = tract_attributes(self.data)
+        self.models = {}
+
+    def model(self, params):
+        """The county's model for these parameters; only the tract cap changes the matrix, so it keys the cache."""
+        max_per_tract = params['max_per_tract']
+        if max_per_tract not in self.models:
+            self.models[max_per_tract] = build_model(self.tracts, self.population, self.snap, self.income,
+                                                     self.edges, max_per_tract=max_per_tract)
+        return set_parameters(self.models[max_per_tract], self.terms, params['alpha'], params['beta'],
+                              params['budget'], params['adjacency_limit'])
+
+    def allocation(self, assigned):
+        """Supermarkets per tract from a {CensusTract: count} mapping."""
+        values = np.zeros(len(self.tracts))
+        for tract, count in assigned.items():
+            if int(tract) not in self.position:
+                raise ValueError(f"tract {tract} is not in the county")
+            values[self.position[int(tract)]] = count
+        return values
+
+
+class AllocationService:
+    """Answers allocate / evaluate / stats queries; shared by the TCP server and the offline client."""
+
+    def __init__(self, workers=os.cpu_count(), cache_size=CACHE_SIZE, atlas_path=ATLAS_PATH, cache_dir=CACHE_DIR,
+                 adjacency_dir='adjacency_csr', solve_options=None):
+        from adjacency import load_adjacency
+
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.slots = asyncio.Semaphore(workers)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.in_flight = {}
+        self.counties = {}
+        self.county_locks = {}
+        self.atlas_path = atlas_path
+        self.cache_dir = cache_dir
+        self.adjacency = load_adjacency(adjacency_dir) if os.path.isdir(adjacency_dir) else None
+        self.solve_options = solve_options or SolveOptions(threads=1)
+        self.stats = {'queries': 0, 'cache_hits': 0, 'solves': 0}
+
+    def close(self):
+        self.pool.shutdown()
+
+    async def county(self, state, county):
+        key = (state, county)
+        if key not in self.counties:
+            lock = self.county_locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                if key not in self.counties:
+                    self.counties[key] = await asyncio.to_thread(County, state, county, self.atlas_path,
+                                                                 self.cache_dir, self.adjacency)
+        return self.counties[key]
+
+    async def cached(self, op, params, compute):
+        """Answer from the LRU cache, join an identical query already running, or compute and cache."""
+        key = query_key(op, params)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return {**self.cache[key], 'cached': True}
+        if key not in self.in_flight:
+            self.in_flight[key] = asyncio.ensure_future(compute())
+        try:
+            result = await asyncio.shield(self.in_flight[key])
+        finally:
+            self.in_flight.pop(key, None)
+        self.cache[key] = result
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return {**result, 'cached': False}
+
+    async def allocate(self, params):
+        county = await self.county(params['state'], params['county'])
+
+        async def compute():
+            model = county.model(params)
+            # The semaphore keeps excess queries waiting here rather than piling up in the pool
+            async with self.slots:
+                self.stats['solves'] += 1
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.pool, solve_allocation, model, self.solve_options)
+            # Raising keeps the failure out of the cache, and evaluate never scores an infeasible assignment
+            if result['status'] not in FEASIBLE_STATUSES:
+                raise ValueError(f"no feasible allocation for these parameters: CBC returned {result['status']}")
+            result['assigned'] = dict(zip(county.tracts.tolist(), result['assigned'].tolist()))
+            return _plain(result)
+
+        return await self.cached('allocate', params, compute)
+
+    async def evaluate(self, params, allocation=None):
+        county = await self.county(params['state'], params['county'])
+        if allocation is None:
+            solved = await self.allocate({key: params[key] for key in DEFAULTS})
+            allocation = solved['assigned']
+            status = solved['status']
+        else:
+            status = 'Given'
+        values = county.allocation(allocation)
+        metrics = evaluate(values, county.attributes, params['eval_alpha'], params['eval_beta'], params['eval_gamma'])
+        return _plain({'status': status, **{metric: value[0] for metric, value in metrics.items()}})
+
+    async def handle(self, request):
+        """Answer one request object with a response object."""
+        self.stats['queries'] += 1
+        start = time.perf_counter()
+        response = {'id': request.get('id') if isinstance(request, dict) else None}
+        try:
+            if not isinstance(request, dict):
+                raise ValueError(f"a request must be a JSON object, not {type(request).__name__}")
+            op = request.get('op')
+            params = {key: request.get(key, default) for key, default in {**DEFAULTS, **EVALUATION_WEIGHTS}.items()}
+            if op == 'allocate':
+                result = await self.allocate({key: params[key] for key in DEFAULTS})
+            elif op == 'evaluate':
+                result = await self.evaluate(params, request.get('allocation'))
+            elif op == 'stats':
+                result = {**self.stats, 'cached_results': len(self.cache), 'counties': len(self.counties),
+                          'workers': self.workers}
+            else:
+                raise ValueError(f"unknown op {op!r}, expected allocate, evaluate or stats")
+            response.update({'ok': True, 'result': result})
+        except Exception as error:
+            response.update({'ok': False, 'error': repr(error)})
+        response['seconds'] = round(time.perf_counter() - start, 6)
+        return response
+
+
+async def serve(service, host=HOST, port=PORT):
+    async def connection(reader, writer):
+        lock = asyncio.Lock()
+
+        async def answer(line):
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as error:
+                response = {'ok': False, 'error': f"invalid JSON: {error}"}
+            else:
+                response = await service.handle(request)
+            async with lock:
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+
+        # Requests on one connection are answered concurrently, each response tagged with its request id
+        tasks = set()
+        while line := await reader.readline():
+            if line.strip():
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        writer.close()
+
+    server = await asyncio.start_server(connection, host, port, limit=2 ** 24)
+    print(f"Allocation service listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def with_id(number, request):
+    """The request tagged with an id; anything but an object is sent as is, for the service to reject."""
+    return {'id': number, **request} if isinstance(request, dict) else request
+
+
+async def query(requests, host=HOST, port=PORT):
+    """Send requests to a running service and return the responses in request order."""
+    requests = [with_id(number, request) for number, request in enumerate(requests)]
+    reader, writer = await asyncio.open_connection(host, port, limit=2 ** 24)
+    for request in requests:
+        writer.write((json.dumps(request) + '\n').encode())
+    await writer.drain()
+    # Responses arrive as their queries finish, so put them back in request order
+    # (requests that are not objects are answered without an id, in the order they were sent)
+    responses = {}
+    rejected = []
+    for _ in requests:
+        response = json.loads(await reader.readline())
+        if response.get('id') is None:
+            rejected.append(response)
+        else:
+            responses[response['id']] = response
+    writer.close()
+    await writer.wait_closed()
+    return [responses.get(request['id']) if isinstance(request, dict) else rejected.pop(0) for request in requests]
+
+
+async def query_offline(requests, **service_options):
+    """Answer requests with an in-process service instead of a running server."""
+    service = AllocationService(**service_options)
+    try:
+        return await asyncio.gather(*(service.handle(request) for request in requests))
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help="run the service")
+    serve_parser.add_argument('--workers', type=int, default=os.cpu_count(), help="concurrent CBC solves")
+    serve_parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="results kept in the LRU cache")
+    serve_parser.add_argument('--time-limit', type=float, help="CBC time limit per solve, in seconds")
+    serve_parser.add_argument('--atlas', default=ATLAS_PATH)
+    serve_parser.add_argument('--cache-dir', default=CACHE_DIR)
+    serve_parser.add_argument('--adjacency', default='adjacency_csr')
+    query_parser = subparsers.add_parser('query', help="send JSON requests and print the responses")
+    query_parser.add_argument('requests', nargs='+', help="JSON request objects")
+    query_parser.add_argument('--offline', action='store_true', help="answer in-process without a server")
+    for subparser in [serve_parser, query_parser]:
+        subparser.add_argument('--host', default=HOST)
+        subparser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        async def main():
+            service = AllocationService(args.workers, args.cache_size, args.atlas, args.cache_dir, args.adjacency,
+                                        SolveOptions(threads=1, time_limit=args.time_limit))
+            try:
+                await serve(service, args.host, args.port)
+            finally:
+                service.close()
+        asyncio.run(main())
+    else:
+        requests = [with_id(number, json.loads(request)) for number, request in enumerate(args.requests)]
+        responses = asyncio.run(query_offline(requests) if args.offline else query(requests, args.host, args.port))
+        for response in responses:
+            print(json.dumps(response))
@@ -0,0 +1,172 @@
+"""
+This module runs CBC for both the PuLP problem in main.py and the array models from model_builder.py, with
+configurable threads, time limit, relative gap, MIP warm starts, scratch directory and opt-in LP/MPS dumps.
+Every solve returns a SolveResult with the status, objective, bound, gap, wall time and node count read from
+the CBC log."""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+FEASIBLE_STATUSES = ('Optimal', 'Feasible')
+
+
+@dataclass
+class SolveOptions:
+    threads: int = os.cpu_count()
+    time_limit: float = None      # seconds
+    gap_rel: float = None         # stop once the relative gap to the bound is below this
+    warm_start: str = None        # previous assigned_supermarkets.csv used as a MIP start
+    scratch_dir: str = None       # where temporary model and solution files go
+    lp_file: str = None           # debug dump of the model in LP format
+    mps_file: str = None          # debug dump of the model in MPS format
+    msg: bool = False             # echo the CBC log
+
+
+@dataclass
+class SolveResult:
+    status: str
+    objective: float
+    bound: float
+    gap: float
+    wall_time: float
+    nodes: int
+    values: np.ndarray = None     # column values, for array models
+
+
+def cbc_arguments(options):
+    """CBC command line settings for the options."""
+    arguments = []
+    if options.threads and options.threads > 1:
+        arguments += ['threads', str(options.threads)]
+    if options.time_limit is not None:
+        arguments += ['sec', str(options.time_limit)]
+    if options.gap_rel is not None:
+        arguments += ['ratio', str(options.gap_rel)]
+    return arguments
+
+
+def _log_number(log, label):
+    match = re.search(rf"^{label}:\s+(\S+)", log, re.MULTILINE)
+    return float(match.group(1)) if match else np.nan
+
+
+def parse_cbc_log(log, sign=1.0):
+    """Status, objective, bound, gap and nodes from the summary at the end of a CBC log.
+
+    `sign` converts CBC's minimisation values to the sense of the caller's model.
+    """
+    result = re.search(r"^Result - (.*)$", log, re.MULTILINE)
+    result = result.group(1).lower() if result else ''
+    objective = sign * _log_number(log, 'Objective value')
+    if 'optimal' in result:
+        status = 'Optimal'
+    elif 'infeasible' in result:
+        status = 'Infeasible'
+    elif 'unbounded' in result:
+        status = 'Unbounded'
+    elif result.startswith('stopped') and not np.isnan(objective):
+        status = 'Feasible'
+    else:
+        status = 'NotSolved'
+
+    # CBC prints "Upper bound" instead of "Lower bound" when it was asked to maximise; its printed gap is
+    # rounded to two decimals, so the relative gap is recomputed from the objective and bound
+    bound = sign * _log_number(log, 'Lower bound')
+    if np.isnan(bound):
+        bound = sign * _log_number(log, 'Upper bound')
+    if status == 'Optimal' and np.isnan(bound):
+        bound = objective
+    gap = abs(bound - objective) / max(abs(objective), 1e-9) if status in FEASIBLE_STATUSES else np.nan
+    nodes = _log_number(log, 'Enumerated nodes')
+    return status, objective, bound, gap, 0 if np.isnan(nodes) else int(nodes)
+
+
+def apply_warm_start(problem, path):
+    """Set supermarkets_<tract> / has_supermarket_<tract> initial values from a previous allocation csv."""
+    import pandas as pd
+
+    previous = pd.read_csv(path)
+    variables = problem.variablesDict()
+    for tract, assigned in zip(previous['CensusTract'].astype(str), previous['Assigned_Supermarkets']):
+        if f"supermarkets_{tract}" in variables:
+            variables[f"supermarkets_{tract}"].setInitialValue(round(assigned))
+        if f"has_supermarket_{tract}" in variables:
+            variables[f"has_supermarket_{tract}"].setInitialValue(int(assigned > 0))
+
+
+def solve_problem(problem, options=SolveOptions()):
+    """Solve a PuLP problem with CBC and return a SolveResult."""
+    from pulp import PULP_CBC_CMD, LpStatus, value
+
+    if options.lp_file:
+        problem.writeLP(options.lp_file)
+    if options.mps_file:
+        problem.writeMPS(options.mps_file)
+    if options.warm_start:
+        apply_warm_start(problem, options.warm_start)
+
+    with tempfile.TemporaryDirectory(dir=options.scratch_dir) as tmp_dir:
+        log_path = os.path.join(tmp_dir, 'cbc.log')
+        solver = PULP_CBC_CMD(msg=False, timeLimit=options.time_limit, gapRel=options.gap_rel,
+                              threads=options.threads, warmStart=bool(options.warm_start), logPath=log_path)
+        solver.tmpDir = tmp_dir
+        start = time.perf_counter()
+        problem.solve(solver)
+        wall_time = time.perf_counter() - start
+        with open(log_path, 'r') as f:
+            log = f.read()
+    if options.msg:
+        print(log)
+
+    # PuLP passes -max for maximisation problems, so the CBC log is already in the problem's sense
+    status, objective, bound, gap, nodes = parse_cbc_log(log)
+    if status == 'NotSolved':
+        status = LpStatus[problem.status]
+    if np.isnan(objective) and status in FEASIBLE_STATUSES:
+        objective = value(problem.objective)
+    return SolveResult(status, objective, bound, gap, wall_time, nodes)
+
+
+def solve_mps(mps_path, num_columns, options=SolveOptions(), mip_start=None, sign=-1.0):
+    """Solve a minimisation MPS file with the CBC binary bundled with PuLP.
+
+    `mip_start` is an optional CBC solution file used as a MIP start. `sign` is applied to the objective
+    and bound, so the default reports them for a maximisation model written with a negated objective.
+    """
+    from pulp import PULP_CBC_CMD
+
+    if options.mps_file:
+        shutil.copyfile(mps_path, options.mps_file)
+    solution_path = os.path.splitext(mps_path)[0] + '.sol'
+    command = [PULP_CBC_CMD().path, mps_path] + cbc_arguments(options)
+    if mip_start:
+        command += ['mips', mip_start]
+    command += ['solve', 'solution', solution_path]
+
+    start = time.perf_counter()
+    log = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    wall_time = time.perf_counter() - start
+    if options.msg:
+        print(log)
+
+    status, objective, bound, gap, nodes = parse_cbc_log(log, sign)
+    values = np.zeros(num_columns)
+    with open(solution_path) as f:
+        header = f.readline()
+        body = f.read().replace('**', '')
+    if body.strip():
+        solution = np.loadtxt(body.splitlines(), usecols=(0, 2), ndmin=2)
+        values[solution[:, 0].astype(np.int64)] = solution[:, 1]
+    if status == 'NotSolved' and 'Result - ' not in log:
+        # Pure LPs have no branch-and-bound summary, only the solution file header
+        status = 'Optimal' if header.startswith('Optimal') else \
+            'Infeasible' if 'nfeasible' in header else status
+        if 'objective value' in header:
+            objective = sign * float(header.rsplit('objective value', 1)[1])
+    return SolveResult(status, objective, bound, gap, wall_time, nodes, values)
@@ -0,0 +1,145 @@
+"""
+This script answers "what if" questions about the main.py model by sweeping a grid of ALPHA, BETA, budget and
+adjacency limit values. The constraint matrix is built once; each grid point only changes the objective
+coefficients and the right-hand sides of TotalSupermarketsLimit and AdjacencyLimit_*, and is warm-started from
+the nearest point already solved by the same worker. Grid points are split across worker processes."""
+import argparse
+import dataclasses
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from adjacency import load_adjacency, edges_for_tracts
+from data_loader import load_county
+from model_builder import build_model, objective_terms, objective_vector, solve_model, assigned_supermarkets, \
+    TOTAL_NEW_SUPERMARKETS, ADJACENCY_LIMIT, ALPHA
+from solver import SolveOptions, FEASIBLE_STATUSES
+
+PARAMETERS = ['alpha', 'beta', 'budget', 'adjacency_limit']
+
+
+def set_parameters(model, terms, alpha, beta, budget, adjacency_limit):
+    """Copy of the model with new objective and right-hand sides; the matrix arrays are shared, not copied."""
+    rhs = model.rhs.copy()
+    rhs[model.total_row] = budget
+    rhs[model.adjacency_rows] = adjacency_limit
+    return dataclasses.replace(model, objective=objective_vector(terms, alpha, beta), rhs=rhs)
+
+
+def repair_start(model, values, budget):
+    """Adjust a previous solution to a new budget, adding or dropping the tracts with the best or worst objective."""
+    n = model.num_tracts
+    supermarkets = values[:n].copy()
+    score = model.objective[:n] + model.objective[n:]
+    difference = int(round(budget - supermarkets.sum()))
+    if difference > 0:
+        candidates = np.flatnonzero(supermarkets < model.upper[:n])
+        supermarkets[candidates[np.argsort(-score[candidates])[:difference]]] += 1
+    elif difference < 0:
+        candidates = np.flatnonzero(supermarkets > 0)
+        supermarkets[candidates[np.argsort(score[candidates])[:-difference]]] -= 1
+    return np.concatenate([supermarkets, (supermarkets > 0).astype(np.float64)])
+
+
+def solve_chain(model, terms, points, scale, options):
+    """Solve a list of grid points in order, warm-starting each from the nearest point solved so far."""
+    solved_points = []
+    solved_values = []
+    results = []
+    for point in points:
+        point_model = set_parameters(model, terms, *point)
+        warm_start = None
+        if solved_points:
+            distances = np.abs((np.array(solved_points) - point) / scale).sum(axis=1)
+            nearest = int(np.argmin(distances))
+            warm_start = repair_start(point_model, solved_values[nearest], point[2])
+
+        result = solve_model(point_model, options, warm_start=warm_start)
+        if result.status in FEASIBLE_STATUSES:
+            solved_points.append(point)
+            solved_values.append(result.values)
+        results.append((result.status, result.objective, result.wall_time,
+                        assigned_supermarkets(point_model, result).astype(np.int8)))
+    return results
+
+
+def coverage(allocations, weights):
+    """Percent of the weight in tracts with at least one supermarket, for each allocation row."""
+    return 100 * ((allocations > 0) @ weights) / weights.sum()
+
+
+def pareto_front(low_income, population):
+    """Mask of points that no other point beats on both low-income and population coverage."""
+    at_most = (low_income[:, None] <= low_income[None, :]) & (population[:, None] <= population[None, :])
+    strictly = (low_income[:, None] < low_income[None, :]) | (population[:, None] < population[None, :])
+    return ~(at_most & strictly).any(axis=1)
+
+
+def run_sweep(county_data, edges, points, workers, options=SolveOptions(threads=1)):
+    """Solve every (alpha, beta, budget, adjacency_limit) point and return the results table."""
+    tracts = county_data['CensusTract'].to_numpy()
+    population = county_data['POP2010'].to_numpy(dtype=np.float64)
+    snap = county_data['TractSNAP'].to_numpy(dtype=np.float64)
+    income = county_data['MedianFamilyIncome'].to_numpy(dtype=np.float64)
+    model = build_model(tracts, population, snap, income, edges)
+    terms = objective_terms(population, snap, income)
+
+    # Neighboring grid points stay in the same chain so every worker can warm-start from a close point
+    points = np.array(points, dtype=np.float64)
+    scale = np.maximum(points.max(axis=0) - points.min(axis=0), 1e-9)
+    chains = [chain for chain in np.array_split(points, min(workers, len(points))) if len(chain)]
+    with ProcessPoolExecutor(max_workers=len(chains)) as pool:
+        results = [result for chain in pool.map(solve_chain, [model] * len(chains), [terms] * len(chains),
+                                                chains, [scale] * len(chains), [options] * len(chains))
+                   for result in chain]
+
+    # Points without an optimal allocation keep their status but no allocation or scores
+    feasible = np.array([result[0] in FEASIBLE_STATUSES for result in results])
+    allocations = np.array([result[3] for result in results])
+    allocations[~feasible] = 0
+    table = pd.DataFrame(points, columns=PARAMETERS)
+    table['status'] = [result[0] for result in results]
+    table['objective'] = np.where(feasible, [result[1] for result in results], np.nan)
+    table['solve_seconds'] = [result[2] for result in results]
+    table['low_income_coverage'] = np.where(feasible, coverage(allocations, snap), np.nan)
+    table['population_coverage'] = np.where(feasible, coverage(allocations, population), np.nan)
+    table['supermarket_tracts'] = [' '.join(map(str, tracts[row > 0])) for row in allocations]
+    front = np.zeros(len(table), dtype=bool)
+    front[feasible] = pareto_front(table['low_income_coverage'].to_numpy()[feasible],
+                                   table['population_coverage'].to_numpy()[feasible])
+    table['pareto'] = front
+    return table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--state', default='California')
+    parser.add_argument('--county', default='Imperial')
+    parser.add_argument('--alpha', type=float, nargs='+', default=[ALPHA])
+    parser.add_argument('--beta', type=float, nargs='+', help="defaults to 1 - alpha for each alpha")
+    parser.add_argument('--budget', type=int, nargs='+', default=[TOTAL_NEW_SUPERMARKETS])
+    parser.add_argument('--adjacency-limit', type=int, nargs='+', default=[ADJACENCY_LIMIT])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--time-limit', type=float, help="CBC time limit per grid point, in seconds")
+    parser.add_argument('--gap', type=float, help="relative MIP gap at which a grid point counts as solved")
+    parser.add_argument('--output', default='sweep_results.csv')
+    args = parser.parse_args()
+
+    selected_columns = ['CensusTract', 'POP2010', 'TractSNAP', 'MedianFamilyIncome']
+    county_data = load_county(args.state, args.county, selected_columns)
+    edges = edges_for_tracts(load_adjacency(), county_data['CensusTract'])
+
+    if args.beta:
+        weights = list(itertools.product(args.alpha, args.beta))
+    else:
+        weights = [(alpha, 1 - alpha) for alpha in args.alpha]
+    points = [weight + rest for weight in weights for rest in itertools.product(args.budget, args.adjacency_limit)]
+    options = SolveOptions(threads=1, time_limit=args.time_limit, gap_rel=args.gap)
+    table = run_sweep(county_data, edges, points, args.workers, options)
+
+    table.to_csv(args.output, index=False)
+    print(table.drop(columns='supermarket_tracts').to_string(index=False))
+    print(f"Sweep results saved to: {args.output}")
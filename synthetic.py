@@ -0,0 +1,35 @@
+"""
+This module generates synthetic counties of any size for benchmarks. Tracts are random points whose
+adjacency is their Delaunay triangulation, which like real tract maps is planar with about three neighbors
+per tract on average, and POP2010, TractSNAP and MedianFamilyIncome follow skewed distributions close to
+Imperial County's."""
+import numpy as np
+import pandas as pd
+from scipy.spatial import Delaunay
+
+from model_builder import unique_edges
+
+
+def synthetic_county(num_tracts, seed=0):
+    """Tract ids, population, SNAP households, median family income and (m, 2) adjacency pairs."""
+    rng = np.random.default_rng(seed)
+    index = np.arange(num_tracts)
+    points = rng.random((num_tracts, 2))
+    if num_tracts >= 3:
+        simplices = Delaunay(points).simplices
+        edges = unique_edges(np.concatenate([simplices[:, [0, 1]], simplices[:, [1, 2]], simplices[:, [0, 2]]]))
+    else:
+        edges = unique_edges(np.column_stack([index[:-1], index[1:]]))
+    tracts = 6000000000 + index
+    population = rng.lognormal(8.2, 0.5, num_tracts).round()
+    snap = (population / 2.8 * rng.beta(2, 8, num_tracts)).round()
+    income = rng.lognormal(10.9, 0.4, num_tracts).round()
+    return tracts, population, snap, income, edges
+
+
+def synthetic_frame(num_tracts, seed=0):
+    """A synthetic county as an atlas-style DataFrame, plus its adjacency pairs."""
+    tracts, population, snap, income, edges = synthetic_county(num_tracts, seed)
+    data = pd.DataFrame({'CensusTract': tracts, 'POP2010': population, 'TractSNAP': snap,
+                         'MedianFamilyIncome': income})
+    return data, edges